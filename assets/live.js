@@ -0,0 +1,71 @@
+// Keep the live-state store in sync with the /live server-sent event stream.
+// Each message is the full state of one machine; the store holds all of them.
+(function () {
+    var states = {};
+    var pending = false;
+
+    function flush() {
+        if (!window.dash_clientside || !window.dash_clientside.set_props) {
+            // Dash is not rendered yet, try again shortly
+            setTimeout(flush, 200);
+            return;
+        }
+        pending = false;
+        window.dash_clientside.set_props('live-state', {data: Object.assign({}, states)});
+    }
+
+    var source = new EventSource('/live');
+    source.onmessage = function (event) {
+        var message = JSON.parse(event.data);
+        window.liveClockOffset = message.server_time * 1000 - Date.now();
+        states[message.state.machine] = message.state;
+        if (!pending) {
+            pending = true;
+            flush();
+        }
+    };
+})();
+
+function pad(value) {
+    return (value < 10 ? '0' : '') + value;
+}
+
+function formatTime(seconds) {
+    seconds = Math.floor(seconds);
+    return pad(Math.floor(seconds / 3600)) + ':' + pad(Math.floor(seconds % 3600 / 60)) + ':' + pad(seconds % 60);
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    live: {
+        // Render the clock and the timers of the current machine from its pushed
+        // state: settled seconds per status plus the time since the last transition
+        render_dashboard: function (n_intervals, states, pathname) {
+            var now = new Date(Date.now() + (window.liveClockOffset || 0));
+            var date = now.getFullYear() + '-' + pad(now.getMonth() + 1) + '-' + pad(now.getDate());
+            var clock = pad(now.getHours()) + ':' + pad(now.getMinutes()) + ':' + pad(now.getSeconds());
+
+            var state = (states || {})[pathname.split('/')[1]];
+            var seconds = {RUNNING: 0, IDLE: 0, DOWN: 0};
+            if (state) {
+                seconds = {RUNNING: state.run_seconds, IDLE: state.idle_seconds, DOWN: state.down_seconds};
+                if (state.status in seconds) {
+                    seconds[state.status] += Math.max(0, now.getTime() / 1000 - state.since);
+                }
+            }
+            var total = seconds.RUNNING + seconds.IDLE + seconds.DOWN;
+            function percent(value) {
+                return total > 0 ? value / total * 100 : 0;
+            }
+
+            return [date, clock,
+                    formatTime(seconds.RUNNING), formatTime(seconds.IDLE), formatTime(seconds.DOWN), formatTime(total),
+                    percent(seconds.RUNNING), percent(seconds.IDLE), percent(seconds.DOWN)];
+        },
+
+        // Pixel width available to the trend chart
+        chart_width: function (start_date) {
+            var graph = document.getElementById('trend-graph');
+            return graph && graph.clientWidth ? graph.clientWidth : window.innerWidth;
+        }
+    }
+});
@@ -0,0 +1,251 @@
+import argparse
+import importlib.util
+import json
+import os
+import random
+import statistics
+import time
+from datetime import date, datetime, timedelta
+import mysql.connector
+from machine_registry import machine_table
+from shift_calendar import ShiftCalendar
+from loadgen import transitions
+import schema
+import rollups
+
+# Database the synthetic history is seeded into. It is created on the server
+# if missing and the dashboard is pointed at it through the environment
+bench_config = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",
+    "database": "machine_bench",
+}
+
+bench_machine = "fanuc"
+dashboard_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "dashboard-fixing.py")
+
+# A run counts as a regression when its median is this much slower than the baseline
+regression_threshold = 0.2
+
+# Intervals of one working day: statuses follow the load generator's transitions
+# and last an exponentially distributed time of mean_seconds on average.
+# The interval still open at `until` is returned without an end
+def day_intervals(rng, calendar, day, mean_seconds, until=None):
+    intervals = []
+    status = "RUNNING"
+    for window_start, window_end in calendar.windows(day):
+        start = window_start
+        while start < window_end:
+            end = min(window_end, start + timedelta(seconds=max(1, int(rng.expovariate(1 / mean_seconds)))))
+            if until is not None and end > until:
+                if start < until:
+                    intervals.append((start, None, status))
+                return intervals
+            intervals.append((start, end, status))
+            choices = transitions[status]
+            status = rng.choices(list(choices), weights=list(choices.values()))[0]
+            start = end
+    return intervals
+
+def interval_row(start, end, status):
+    if end is None:
+        return (start.date(), start.time(), None, None, status)
+    return (start.date(), start.time(), end.time(), str(end - start), status)
+
+def seed_parameters(cursor):
+    cursor.execute("CREATE TABLE IF NOT EXISTS benchmark_seed (parameters VARCHAR(255) NOT NULL)")
+    cursor.execute("SELECT parameters FROM benchmark_seed")
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+# Fill the machine table with `months` of history ending now, plus its rollups
+# and today's OEE row. The history is drawn from a fixed random seed, so runs
+# with the same parameters time the same data; a seed of the same day is reused
+def seed(connection, months, mean_seconds, random_seed, reseed=False):
+    cursor = connection.cursor()
+    today = date.today()
+    parameters = json.dumps({"months": months, "mean_seconds": mean_seconds, "seed": random_seed, "today": str(today)})
+    if not reseed and seed_parameters(cursor) == parameters:
+        print("Reusing the seeded history")
+        return
+
+    table = machine_table(bench_machine)
+    print(f"Seeding {months} months of history into {bench_config['database']}.{table}")
+    cursor.execute(f"TRUNCATE TABLE {table}")
+    cursor.execute("DELETE FROM benchmark_seed")
+    cursor.execute("DELETE FROM oee WHERE id = %s", (bench_machine,))
+
+    rng = random.Random(random_seed)
+    calendar = ShiftCalendar()
+    now = datetime.now().replace(microsecond=0)
+    day = schema.month_start(today, -months).replace(day=min(today.day, 28))
+    rows = []
+    total = 0
+    while day <= today:
+        rows += [interval_row(*interval) for interval in day_intervals(rng, calendar, day, mean_seconds, now if day == today else None)]
+        if len(rows) >= 10000 or day == today:
+            cursor.executemany(f"INSERT INTO {table} (date, start_time, end_time, duration, status) VALUES (%s, %s, %s, %s, %s)", rows)
+            connection.commit()
+            total += len(rows)
+            rows = []
+        day += timedelta(days=1)
+
+    rollups.backfill(cursor, bench_machine)
+    cursor.execute("INSERT INTO oee (id, date, plan, actual, percentage) VALUES (%s, %s, 200, 150, '75.00 %')", (bench_machine, today))
+    cursor.execute("INSERT INTO benchmark_seed (parameters) VALUES (%s)", (parameters,))
+    connection.commit()
+    cursor.close()
+    print(f"Seeded {total} rows")
+
+def prepare_database(months, mean_seconds, random_seed, reseed):
+    server_config = {key: value for key, value in bench_config.items() if key != "database"}
+    connection = mysql.connector.connect(**server_config)
+    connection.cursor().execute(f"CREATE DATABASE IF NOT EXISTS {bench_config['database']}")
+    connection.close()
+
+    connection = mysql.connector.connect(**bench_config)
+    schema.migrate(connection)
+    seed(connection, months, mean_seconds, random_seed, reseed)
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {machine_table(bench_machine)}")
+    row_count = cursor.fetchone()[0]
+    cursor.execute("SELECT VERSION()")
+    version = cursor.fetchone()[0]
+    cursor.close()
+    connection.close()
+    return row_count, version
+
+# Import the dashboard against the seeded database, without MQTT. Unless
+# `cached`, the result cache keeps nothing so every call reaches MySQL
+def load_dashboard(cached=False):
+    os.environ.update({
+        "MQTT_SERVER": "",
+        "MYSQL_HOST": bench_config["host"],
+        "MYSQL_USER": bench_config["user"],
+        "MYSQL_PASSWORD": bench_config["password"],
+        "MYSQL_DATABASE": bench_config["database"],
+    })
+    spec = importlib.util.spec_from_file_location("dashboard", dashboard_path)
+    dashboard = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(dashboard)
+    if not cached:
+        dashboard.result_cache.max_entries = 0
+    return dashboard
+
+# The undecorated function behind a Dash callback
+def callback(function):
+    return getattr(function, "__wrapped__", function)
+
+def consume(chunks):
+    for _ in chunks:
+        pass
+
+# Benchmark cases as (name, function) over fixed ranges relative to today
+def build_cases(dashboard):
+    monitor = dashboard.machines[bench_machine]
+    pathname = f"/{bench_machine}/database"
+    today = date.today()
+    day = str(today)
+    week = str(today - timedelta(days=6))
+    month = str(today - timedelta(days=30))
+
+    update_table = callback(dashboard.update_table)
+    first_page = update_table(0, {}, month, day, 0, [], "", dashboard.page_size, None, pathname)[2]
+    tenth_page = first_page
+    for page in range(1, 11):
+        tenth_page = update_table(0, {}, month, day, page, [], "", dashboard.page_size, tenth_page, pathname)[2]
+
+    def unchanged_poll():
+        cursor = dict(first_page, page=0)
+        update_table(0, {}, month, day, 0, [], "", dashboard.page_size, cursor, pathname)
+
+    return [
+        ("query fetch_initial_counters", monitor.fetch_initial_counters),
+        ("query fetch_data_from_mysql day", lambda: monitor.fetch_data_from_mysql(day, day)),
+        ("query fetch_data_from_mysql month", lambda: monitor.fetch_data_from_mysql(month, day)),
+        ("query iter_export_chunks month", lambda: consume(monitor.iter_export_chunks(month, day))),
+        ("query fetch_range_totals month", lambda: monitor.fetch_range_totals(month, day)),
+        ("query fetch_oee_export", monitor.fetch_oee_export),
+        ("callback update_table first page month", lambda: update_table(0, {}, month, day, 0, [], "", dashboard.page_size, None, pathname)),
+        ("callback update_table page 11 keyset", lambda: update_table(0, {}, month, day, 11, [], "", dashboard.page_size, dict(tenth_page), pathname)),
+        ("callback update_table page 11 sorted by duration", lambda: update_table(0, {}, month, day, 11, [{"column_id": "duration", "direction": "desc"}], "", dashboard.page_size, None, pathname)),
+        ("callback update_table filtered week", lambda: update_table(0, {}, week, day, 0, [], "{status} = RUNNING && {duration} > 00:05:00", dashboard.page_size, None, pathname)),
+        ("callback update_table unchanged poll", unchanged_poll),
+        ("callback update_range_totals month", lambda: callback(dashboard.update_range_totals)(month, day, pathname)),
+        ("callback download_data week", lambda: callback(dashboard.download_data)(1, week, day, pathname)),
+        ("callback update_andon", lambda: callback(dashboard.update_andon)(0, {}, f"/{bench_machine}/oee")),
+    ]
+
+def measure(function, repeat, warmup):
+    for _ in range(warmup):
+        function()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return {
+        "min_ms": round(samples[0], 3),
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[min(len(samples) - 1, int(0.95 * len(samples)))], 3),
+    }
+
+def compare(results, baseline):
+    regressions = []
+    for name, timing in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        change = timing["median_ms"] / before["median_ms"] - 1 if before["median_ms"] else 0
+        flag = ""
+        if change > regression_threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:55} {before['median_ms']:10.2f} -> {timing['median_ms']:10.2f} ms  {change:+7.1%}{flag}")
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time the dashboard callbacks and queries on synthetic history")
+    parser.add_argument("--months", type=int, default=3)
+    parser.add_argument("--mean-seconds", type=int, default=60, help="mean length of a synthetic interval")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--cached", action="store_true", help="time with the dashboard's result cache enabled")
+    parser.add_argument("--only", help="run the cases whose name contains this text")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", metavar="BASELINE", help="compare with the results of an earlier run and fail on regressions")
+    args = parser.parse_args()
+
+    row_count, version = prepare_database(args.months, args.mean_seconds, args.seed, args.reseed)
+    dashboard = load_dashboard(args.cached)
+
+    results = {}
+    for name, function in build_cases(dashboard):
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(function, args.repeat, args.warmup)
+        timing = results[name]
+        print(f"{name:55} min {timing['min_ms']:10.2f}  median {timing['median_ms']:10.2f}  p95 {timing['p95_ms']:10.2f} ms")
+
+    report = {
+        "rows": row_count,
+        "mysql": version,
+        "parameters": {"months": args.months, "mean_seconds": args.mean_seconds, "seed": args.seed, "repeat": args.repeat, "cached": args.cached},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline["parameters"] != report["parameters"]:
+            print("Baseline was taken with other parameters, timings are not comparable")
+        regressions = compare(results, baseline["results"])
+        if regressions:
+            raise SystemExit(f"{len(regressions)} regressions over {regression_threshold:.0%}")
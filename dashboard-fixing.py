@@ -1,97 +1,475 @@
 import dash
-from dash import dcc, html
+from dash import dcc, html, no_update
 from dash import dash_table as dt
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
 import dash_bootstrap_components as dbc
 import paho.mqtt.client as mqtt
 import mysql.connector
+import threading
+import queue
+import json
 import time
+import os
 import pandas as pd
+import plotly.graph_objects as go
+from plotly.subplots import make_subplots
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from collections import namedtuple, OrderedDict
+from types import MappingProxyType
+from flask import Response, request, stream_with_context
+from timeline import StateTimeline
+from table_query import sort_keys, parse_filter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 machine_configs = {
     "fanuc": {"mqtt_topics": ["R01/ON", "R02/ON", "R12/OFF"]},
 }
 
-mqtt_server = "192.168.1.7"
+# Broker and database may be overridden from the environment (benchmark.py
+# does); an empty MQTT_SERVER runs the monitors without live updates
+mqtt_server = os.environ.get("MQTT_SERVER", "192.168.1.7")
 
 mysql_config = {
-    "host": "localhost",
-    "user": "root",
-    "password": "12345",
-    "database": "machine",
+    "host": os.environ.get("MYSQL_HOST", "localhost"),
+    "user": os.environ.get("MYSQL_USER", "root"),
+    "password": os.environ.get("MYSQL_PASSWORD", "12345"),
+    "database": os.environ.get("MYSQL_DATABASE", "machine"),
+}
+
+# Shared MySQL connections for all monitors and callbacks. Idle connections
+# are pinged before reuse once they have been idle for health_check_interval
+pool_config = {
+    "pool_size": 5,
+    "pool_timeout": 5,
+    "health_check_interval": 30,
+}
+
+# Seconds between keepalive comments on an idle /live stream
+live_keepalive = 15
+
+# Seconds between snapshot rebuilds when no machine changes state
+snapshot_interval = 1
+
+# Rows per page of the Database datatable
+page_size = 50
+
+# Rows per chunk read from the server-side cursor by the streaming export
+export_chunk_size = 5000
+export_columns = ["date", "start_time", "end_time", "duration", "status"]
+
+# Query results kept in memory. Ranges ending before yesterday and before the
+# machine's oldest open row can no longer change and stay until evicted (least
+# recently used first); anything else lives ttl seconds and is dropped as soon
+# as the machine reports a transition
+cache_config = {
+    "max_entries": 500,
+    "ttl": 10,
+}
+
+# Seconds of transitions each monitor keeps in its in-memory timeline. Today's
+# totals are answered from it, so it should span at least a day
+timeline_window = 48 * 3600
+
+# Points of the trend chart: one per pixel of the chart width, within these bounds
+trend_config = {
+    "min_points": 100,
+    "max_points": 2000,
 }
 
+# Rollups the trend is read from, with their bucket length in seconds
+trend_sources = [("rollup_minute", 60), ("rollup_hour", 3600), ("rollup_day", 86400)]
+trend_colors = {"RUNNING": "seagreen", "IDLE": "goldenrod", "DOWN": "firebrick"}
+
 app = dash.Dash(__name__, suppress_callback_exceptions=True, external_stylesheets=[dbc.themes.BOOTSTRAP, dbc.icons.BOOTSTRAP])
 
+class ConnectionPool:
+    def __init__(self, mysql_config, pool_size, pool_timeout, health_check_interval):
+        self.mysql_config = mysql_config
+        self.pool_timeout = pool_timeout
+        self.health_check_interval = health_check_interval
+        self.slots = threading.BoundedSemaphore(pool_size)
+        self.idle = queue.LifoQueue()
+
+    @contextmanager
+    def connection(self):
+        if not self.slots.acquire(timeout=self.pool_timeout):
+            raise mysql.connector.errors.PoolError(f"No MySQL connection available after {self.pool_timeout}s")
+        try:
+            connection = self.checkout()
+            try:
+                yield connection
+            except BaseException:
+                # Also covers an abandoned streaming read that left rows unread
+                self.discard(connection)
+                raise
+            self.idle.put((time.monotonic(), connection))
+        finally:
+            self.slots.release()
+
+    def checkout(self):
+        while True:
+            try:
+                last_used, connection = self.idle.get_nowait()
+            except queue.Empty:
+                # Autocommit so a reused connection never reads from a stale snapshot
+                return mysql.connector.connect(autocommit=True, **self.mysql_config)
+            if time.monotonic() - last_used < self.health_check_interval:
+                return connection
+            try:
+                connection.ping()
+                return connection
+            except mysql.connector.Error:
+                self.discard(connection)
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except mysql.connector.Error:
+            pass
+
+class ResultCache:
+    missing = object()
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    # Yesterday can still change when an interval open across midnight closes,
+    # and any day from the oldest open row on when that row closes
+    def immutable(self, end_date, oldest_open):
+        if end_date is None or (oldest_open is not None and str(end_date)[:10] >= oldest_open):
+            return False
+        return str(end_date)[:10] < time.strftime("%Y-%m-%d", time.localtime(time.time() - 86400))
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return self.missing
+            expires, value = entry
+            if expires is not None and expires < time.monotonic():
+                del self.entries[key]
+                return self.missing
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, end_date, value, oldest_open=None):
+        expires = None if self.immutable(end_date, oldest_open) else time.monotonic() + self.ttl
+        with self.lock:
+            self.entries[key] = (expires, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    # Drop the entries of a machine that may still change
+    def invalidate(self, machine):
+        with self.lock:
+            for key in [key for key, (expires, value) in self.entries.items() if key[0] == machine and expires is not None]:
+                del self.entries[key]
+
+# Fans machine state changes out to every open /live stream. A client that falls
+# behind loses messages, which is harmless because each one carries the full state
+class Broadcaster:
+    def __init__(self, queue_size=100):
+        self.lock = threading.Lock()
+        self.subscribers = set()
+        self.queue_size = queue_size
+
+    def subscribe(self):
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscribers.discard(subscription)
+
+    def publish(self, message):
+        with self.lock:
+            subscribers = list(self.subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(message)
+            except queue.Full:
+                pass
+
 def format_time(seconds):
         hours, remainder = divmod(seconds, 3600)
         minutes, seconds = divmod(remainder, 60)
         return '{:02}:{:02}:{:02}'.format(int(hours), int(minutes), int(seconds))
 
+# Epoch seconds of the local midnight starting the day of `timestamp`
+def local_midnight(timestamp):
+    return datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+# The newest open row of each status. Older open rows were left behind by a
+# repeated start before the ingest ignored those, and are not active
+newest_open_rows = "id IN (SELECT id FROM (SELECT MAX(id) AS id FROM fanuc WHERE duration IS NULL GROUP BY status) AS newest)"
+
 class RealTimeMonitor:
-    def __init__(self, machine_name, mqtt_server, mysql_config, mqtt_topics):
-        self.machine_name = 'fanuc'
+    def __init__(self, machine_name, mqtt_server, pool, mqtt_topics, cache):
+        self.machine_name = machine_name
+        self.pool = pool
+        self.cache = cache
+        self.listeners = []
         self.run_increment = False
         self.idle_increment = False
         self.down_increment = False
+        # Seconds of the current day settled up to active_since; the active
+        # status keeps accumulating from active_since until the next transition
         self.run_seconds = 0
         self.idle_seconds = 0
         self.down_seconds = 0
-        self.total_seconds = 0
+        self.active_status = None
+        self.active_since = time.time()
+        self.counter_midnight = local_midnight(self.active_since)
+        self.lock = threading.Lock()
+        self.timeline = StateTimeline(timeline_window)
+        self.oldest_open = None
+        self.oldest_open_checked = None
+
+        self.fetch_initial_counters()
 
-        self.client = mqtt.Client()
-        self.client.on_connect = self.on_connect
-        self.client.on_message = self.on_message
-        self.client.connect(mqtt_server, 1883, 0)
         self.full_topic = [f"fanuc/{topic}" for topic in mqtt_topics]
-        self.client.loop_start()
+        if mqtt_server:
+            self.client = mqtt.Client()
+            self.client.on_connect = self.on_connect
+            self.client.on_message = self.on_message
+            self.client.connect(mqtt_server, 1883, 0)
+            self.client.loop_start()
 
-        self.fetch_initial_counters()
+    # Result of fetch() for a query key, from the cache while it is valid.
+    # Cached results are shared, so callers must not modify them
+    def cached(self, key, end_date, fetch):
+        key = (self.machine_name,) + key
+        value = self.cache.get(key)
+        if value is ResultCache.missing:
+            value = fetch()
+            self.cache.put(key, end_date, value, self.oldest_open_date())
+        return value
+
+    # Date of the oldest row still open, refreshed at most every cache ttl.
+    # New rows open today, so a stale date is too early at worst and only
+    # gives more results an expiry
+    def oldest_open_date(self):
+        if self.oldest_open_checked is None or time.monotonic() - self.oldest_open_checked >= self.cache.ttl:
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT MIN(date) FROM fanuc WHERE duration IS NULL")
+                oldest = cursor.fetchone()[0]
+                cursor.close()
+            self.oldest_open = str(oldest) if oldest is not None else None
+            self.oldest_open_checked = time.monotonic()
+        return self.oldest_open
+
+    def invalidate(self):
+        self.cache.invalidate(self.machine_name)
 
     # Fetch the required data from the MySQL database
     def fetch_data_from_mysql(self, start_date, end_date):
-        connection = mysql.connector.connect(**mysql_config)
-        cursor = connection.cursor()
-        cursor.execute(f"SELECT * FROM fanuc WHERE date BETWEEN %s AND %s", (start_date, end_date))
-        data = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        def fetch():
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute("SELECT date, start_time, end_time, duration, status FROM fanuc WHERE date BETWEEN %s AND %s ORDER BY date, start_time", (start_date, end_date))
+                data = cursor.fetchall()
+                cursor.close()
+            return data
+        return self.cached(('rows', start_date, end_date), end_date, fetch)
+
+    # Fetch one page of rows. Pages after the first start at a known key of the
+    # order columns (keyset), or at an offset when no key is known yet
+    def fetch_page(self, start_date, end_date, conditions, params, order_columns, descending, start_key, offset, limit):
+        def fetch():
+            where = ["date BETWEEN %s AND %s"] + conditions
+            values = [start_date, end_date] + params
+            if start_key is not None:
+                placeholders = ", ".join(["%s"] * len(order_columns))
+                where.append(f"({', '.join(order_columns)}) {'<=' if descending else '>='} ({placeholders})")
+                values += start_key
+            order = ", ".join(f"{column} DESC" if descending else column for column in order_columns)
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    f"SELECT date, start_time, end_time, duration, status FROM fanuc WHERE {' AND '.join(where)} "
+                    f"ORDER BY {order} LIMIT %s OFFSET %s",
+                    values + [limit, offset]
+                )
+                data = cursor.fetchall()
+                cursor.close()
+            return data
+        return self.cached(('page', start_date, end_date, tuple(conditions), tuple(params), tuple(order_columns), descending,
+                            tuple(start_key) if start_key is not None else None, offset, limit), end_date, fetch)
+
+    # Fetch the (date, start_time, status) of the newest row up to end_date
+    def fetch_last_key(self, end_date):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT date, start_time, status FROM fanuc WHERE date <= %s ORDER BY date DESC, start_time DESC, status DESC LIMIT 1", (end_date,))
+            row = cursor.fetchone()
+            cursor.close()
+        return [str(value) for value in row] if row else None
+
+    def has_rows_after(self, key, end_date):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT 1 FROM fanuc WHERE date <= %s AND (date, start_time, status) > (%s, %s, %s) LIMIT 1", [end_date] + key)
+            found = cursor.fetchone() is not None
+            cursor.close()
+        return found
+
+    # Fetch the rows among keys (date, start_time, status) that have been closed
+    def fetch_closed_rows(self, keys):
+        placeholders = ", ".join(["(%s, %s, %s)"] * len(keys))
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT date, start_time, end_time, duration, status FROM fanuc "
+                f"WHERE duration IS NOT NULL AND (date, start_time, status) IN ({placeholders})",
+                [value for key in keys for value in key]
+            )
+            data = cursor.fetchall()
+            cursor.close()
         return data
 
+    # Rows of a date range as DataFrames of chunk_size rows, formatted by MySQL and
+    # read through an unbuffered cursor, so only one chunk is held in memory
+    def iter_export_chunks(self, start_date, end_date, chunk_size=export_chunk_size):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(buffered=False)
+            cursor.execute(
+                "SELECT DATE_FORMAT(date, '%%Y-%%m-%%d'), TIME_FORMAT(start_time, '%%H:%%i:%%s'), "
+                "TIME_FORMAT(end_time, '%%H:%%i:%%s'), TIME_FORMAT(duration, '%%H:%%i:%%s'), status "
+                "FROM fanuc WHERE date BETWEEN %s AND %s ORDER BY date, start_time",
+                (start_date, end_date)
+            )
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield pd.DataFrame(rows, columns=export_columns)
+            cursor.close()
+
     # Fetch the oee
     def fetch_oee_data(self):
-        connection = mysql.connector.connect(**mysql_config)
-        cursor = connection.cursor()
-        cursor.execute(f"SELECT * FROM oee WHERE date = CURDATE() AND id = 'fanuc'")
-        data = cursor.fetchall()
-        cursor.close()
-        connection.close()
+        def fetch():
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(f"SELECT * FROM oee WHERE date = CURDATE() AND id = 'fanuc'")
+                data = cursor.fetchall()
+                cursor.close()
+            return data
+        return self.cached(('oee',), None, fetch)
+
+    # Fetch the oee row of today with the time per status from the day rollup
+    def fetch_oee_export(self):
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute(
+                "SELECT o.id, o.date, o.plan, o.actual, o.percentage, "
+                "COALESCE(SUM(CASE WHEN r.status = 'RUNNING' THEN r.seconds END), 0), "
+                "COALESCE(SUM(CASE WHEN r.status = 'IDLE' THEN r.seconds END), 0), "
+                "COALESCE(SUM(CASE WHEN r.status = 'DOWN' THEN r.seconds END), 0) "
+                "FROM oee o LEFT JOIN rollup_day r ON r.machine_id = o.id AND r.bucket = o.date "
+                "WHERE o.date = CURDATE() AND o.id = %s GROUP BY o.id, o.date, o.plan, o.actual, o.percentage",
+                (self.machine_name,)
+            )
+            data = cursor.fetchall()
+            cursor.close()
         return data
 
+    # Seconds per status over a date range, from the timeline for today and
+    # from the day rollup otherwise
+    def fetch_range_totals(self, start_date, end_date):
+        today = time.strftime("%Y-%m-%d")
+        midnight = time.mktime(time.strptime(today, "%Y-%m-%d"))
+        if start_date == end_date == today and self.timeline.covers(midnight):
+            return {status: int(seconds) for status, seconds in self.timeline.seconds_between(midnight).items()}
+
+        def fetch():
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    "SELECT status, SUM(seconds) FROM rollup_day WHERE machine_id = %s AND bucket BETWEEN %s AND %s GROUP BY status",
+                    (self.machine_name, start_date, end_date)
+                )
+                totals = {status: int(seconds) for status, seconds in cursor.fetchall()}
+                cursor.close()
+            return totals
+        return self.cached(('totals', start_date, end_date), end_date, fetch)
+
+    # Seconds per (slot, status) of a rollup, summed into slots of slot_seconds from start
+    def fetch_trend(self, table, start, end, slot_seconds):
+        def fetch():
+            with self.pool.connection() as connection:
+                cursor = connection.cursor()
+                cursor.execute(
+                    f"SELECT FLOOR(TIMESTAMPDIFF(SECOND, %s, bucket) / %s) AS slot, status, SUM(seconds) FROM {table} "
+                    "WHERE machine_id = %s AND bucket >= %s AND bucket < %s GROUP BY slot, status",
+                    (start, slot_seconds, self.machine_name, start, end)
+                )
+                data = cursor.fetchall()
+                cursor.close()
+            return data
+        return self.cached(('trend', table, start, end, slot_seconds), end, fetch)
+
     def fetch_initial_counters(self):
-        connection = mysql.connector.connect(**mysql_config)
-        cursor = connection.cursor(dictionary=True)
+        with self.pool.connection() as connection:
+            cursor = connection.cursor(dictionary=True)
 
-        # SQL query to calculate total duration for each status for the current date
-        sql_query = f"SELECT status, SUM(CASE WHEN end_time IS NOT NULL THEN TIME_TO_SEC(duration)ELSE TIMESTAMPDIFF(SECOND, start_time, NOW()) END) as total_duration FROM fanuc GROUP BY status;"
-        cursor.execute(sql_query)
+            # Settled seconds: closed intervals of the current date, from the day rollup
+            cursor.execute("SELECT status, seconds FROM rollup_day WHERE machine_id = %s AND bucket = CURDATE()", (self.machine_name,))
+            settled = {'RUNNING': 0, 'IDLE': 0, 'DOWN': 0}
+            for row in cursor.fetchall():
+                if row['status'] in settled:
+                    settled[row['status']] += int(row['seconds'])
 
-        # Process fetched data and update counters
-        for row in cursor.fetchall():
-            status = row['status']
-            total_duration = row['total_duration']
+            # The newest open row of each status sets the relay flags; the active
+            # status then counts from its start (or midnight) as after a transition
+            cursor.execute(
+                "SELECT status, TIMESTAMP(date, start_time) AS start FROM fanuc "
+                f"WHERE status IN ('RUNNING', 'IDLE', 'DOWN') AND {newest_open_rows}"
+            )
+            open_since = {row['status']: row['start'].timestamp() for row in cursor.fetchall()}
 
-            if status == 'RUNNING':
-                self.run_seconds = total_duration
-            elif status == 'IDLE':
-                self.idle_seconds = total_duration
-            elif status == 'DOWN':
-                self.down_seconds = total_duration
+            with self.lock:
+                self.run_seconds = settled['RUNNING']
+                self.idle_seconds = settled['IDLE']
+                self.down_seconds = settled['DOWN']
+                self.run_increment = 'RUNNING' in open_since
+                self.idle_increment = 'IDLE' in open_since
+                self.down_increment = 'DOWN' in open_since
+                self.active_status = self.current_status()
+                if self.active_status is not None:
+                    self.active_since = max(open_since[self.active_status], self.counter_midnight)
 
-            self.total_seconds += total_duration
+            # Today's transitions for the timeline: every interval of today (or
+            # still open, or closed today after midnight) starts its status and
+            # ends it again; a start at the same moment as an end wins
+            cursor.execute(
+                "SELECT GREATEST(TIMESTAMP(date, start_time), CURDATE()) AS start, "
+                "TIMESTAMP(date, start_time) + INTERVAL TIME_TO_SEC(duration) SECOND AS end, status FROM fanuc "
+                "WHERE status IN ('RUNNING', 'IDLE', 'DOWN') AND (duration IS NOT NULL AND (date = CURDATE() "
+                f"OR (date = CURDATE() - INTERVAL 1 DAY AND end_time < start_time)) OR {newest_open_rows})"
+            )
+            midnight = time.mktime(time.strptime(time.strftime("%Y-%m-%d"), "%Y-%m-%d"))
+            transitions = [(midnight, 0, None)]
+            for row in cursor.fetchall():
+                transitions.append((row['start'].timestamp(), 1, row['status']))
+                if row['end'] is not None:
+                    transitions.append((row['end'].timestamp(), 0, None))
+            for timestamp, order, status in sorted(transitions, key=lambda transition: transition[:2]):
+                self.timeline.append(timestamp, status)
 
-        cursor.close()
-        connection.close()
+            cursor.close()
 
     def on_connect(self, client, userdata, flags, rc):
         print("Connected with result code " + str(rc))
@@ -100,35 +478,137 @@ class RealTimeMonitor:
 
     def on_message(self, client, userdata, msg):
         print(f"{msg.topic}: {msg.payload.decode()}")
-        c = msg.payload.decode()
+        # Load-test payloads carry "|<send time>" after the value
+        c = msg.payload.decode().partition("|")[0]
+        timestamp = time.time()
 
-        if msg.topic == self.full_topic[0]:
-            self.run_increment = (c == "true")
-        elif msg.topic == self.full_topic[1]:
-            self.down_increment = (c == "true")
-        elif msg.topic == self.full_topic[2]:
-            self.idle_increment = (c == "true")
+        with self.lock:
+            previous_status = self.active_status
+            if msg.topic == self.full_topic[0]:
+                self.run_increment = (c == "true")
+            elif msg.topic == self.full_topic[1]:
+                self.down_increment = (c == "true")
+            elif msg.topic == self.full_topic[2]:
+                self.idle_increment = (c == "true")
+            self.record_transition(timestamp)
 
-    def update_time(self):
+        # The ingest is about to write this transition
+        self.invalidate()
+
+        if self.active_status != previous_status:
+            state = self.get_state()
+            for listener in self.listeners:
+                listener(state)
+
+    def current_status(self):
         if self.run_increment:
-            self.run_seconds += 1
+            return 'RUNNING'
         elif self.idle_increment:
-            self.idle_seconds += 1
+            return 'IDLE'
         elif self.down_increment:
-            self.down_seconds += 1
+            return 'DOWN'
+        return None
+
+    # Start the counters of a new day at local midnight: the settled seconds
+    # belong to the previous day and the active status counts from midnight
+    def rollover(self, now):
+        midnight = local_midnight(now)
+        if midnight <= self.counter_midnight:
+            return
+        self.run_seconds = 0
+        self.idle_seconds = 0
+        self.down_seconds = 0
+        self.active_since = max(self.active_since, midnight)
+        self.counter_midnight = midnight
+
+    # Settle the time spent in the previous status and start timing the new one
+    def record_transition(self, timestamp):
+        self.rollover(timestamp)
+        elapsed = max(0, timestamp - self.active_since)
+        if self.active_status == 'RUNNING':
+            self.run_seconds += elapsed
+        elif self.active_status == 'IDLE':
+            self.idle_seconds += elapsed
+        elif self.active_status == 'DOWN':
+            self.down_seconds += elapsed
+        self.active_status = self.current_status()
+        self.active_since = timestamp
+        self.timeline.append(timestamp, self.active_status)
 
-        self.total_seconds = self.run_seconds + self.idle_seconds + self.down_seconds
+    def get_seconds(self, now=None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self.rollover(now)
+            run_seconds, idle_seconds, down_seconds = self.run_seconds, self.idle_seconds, self.down_seconds
+            elapsed = max(0, now - self.active_since)
+            if self.active_status == 'RUNNING':
+                run_seconds += elapsed
+            elif self.active_status == 'IDLE':
+                idle_seconds += elapsed
+            elif self.active_status == 'DOWN':
+                down_seconds += elapsed
+        return run_seconds, idle_seconds, down_seconds
+
+    # Settled seconds per status plus the active status and since when it is active
+    def get_state(self):
+        with self.lock:
+            self.rollover(time.time())
+            return {
+                'machine': self.machine_name,
+                'status': self.active_status,
+                'since': self.active_since,
+                'run_seconds': self.run_seconds,
+                'idle_seconds': self.idle_seconds,
+                'down_seconds': self.down_seconds,
+            }
 
     def get_time_data(self):
-        runtime = format_time(self.run_seconds)
-        idletime = format_time(self.idle_seconds)
-        downtime = format_time(self.down_seconds)
-        total_time = format_time(self.total_seconds)
-        runtime_percent = (self.run_seconds / self.total_seconds) * 100 if self.total_seconds > 0 else 0
-        idletime_percent = (self.idle_seconds / self.total_seconds) * 100 if self.total_seconds > 0 else 0
-        downtime_percent = (self.down_seconds / self.total_seconds) * 100 if self.total_seconds > 0 else 0
+        return time_data(*self.get_seconds())
+
+def time_data(run_seconds, idle_seconds, down_seconds):
+    total_seconds = run_seconds + idle_seconds + down_seconds
+    runtime = format_time(run_seconds)
+    idletime = format_time(idle_seconds)
+    downtime = format_time(down_seconds)
+    total_time = format_time(total_seconds)
+    runtime_percent = (run_seconds / total_seconds) * 100 if total_seconds > 0 else 0
+    idletime_percent = (idle_seconds / total_seconds) * 100 if total_seconds > 0 else 0
+    downtime_percent = (down_seconds / total_seconds) * 100 if total_seconds > 0 else 0
+
+    return runtime, idletime, downtime, total_time, runtime_percent, idletime_percent, downtime_percent
+
+Snapshot = namedtuple("Snapshot", ["taken_at", "machines"])
 
-        return runtime, idletime, downtime, total_time, runtime_percent, idletime_percent, downtime_percent
+# One ticker per process builds an immutable snapshot of the serialized state
+# of every machine; readers only take `current`. State changes wake it early
+# and are published to the /live streams from here
+class SnapshotProducer:
+    def __init__(self, monitors, broadcaster, interval):
+        self.monitors = monitors
+        self.broadcaster = broadcaster
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.current = self.build()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def wake(self):
+        self.wakeup.set()
+
+    def build(self):
+        states = {name: json.dumps(monitor.get_state()) for name, monitor in self.monitors.items()}
+        return Snapshot(time.time(), MappingProxyType(states))
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            previous, self.current = self.current, self.build()
+            for name, state in self.current.machines.items():
+                if state != previous.machines[name]:
+                    self.broadcaster.publish(state)
 
 # Define a specific configuration for the 'fanuc' machine
 machine_configs = {
@@ -137,21 +617,32 @@ machine_configs = {
     }
 }
 
+mysql_pool = ConnectionPool(mysql_config, **pool_config)
+result_cache = ResultCache(**cache_config)
+broadcaster = Broadcaster()
+
 # Create instances for each machine
 machines = {}
 for machine_name, config in machine_configs.items():
     machine = RealTimeMonitor(
         machine_name,
         mqtt_server,
-        mysql_config,
+        mysql_pool,
         config["mqtt_topics"],
+        result_cache,
     )
     machines[machine_name] = machine
 
+snapshot_producer = SnapshotProducer(machines, broadcaster, snapshot_interval)
+for machine in machines.values():
+    machine.listeners.append(lambda state: snapshot_producer.wake())
+snapshot_producer.start()
+
 button_group = dbc.ButtonGroup([
     dbc.Button("Dashboard", id="btn-dashboard", n_clicks=0, className="btn-nav"),
     dbc.Button("Database", id="btn-database", n_clicks=0, className="btn-nav"),
     dbc.Button("OEE", id="btn-oee", n_clicks=0, className="btn-nav"),
+    dbc.Button("Trend", id="btn-trend", n_clicks=0, className="btn-nav"),
 ], className="btn_group")
 
 main_layout = dbc.Container([
@@ -250,10 +741,15 @@ database_layout = {
             # ], className="date-column"),        
             # dbc.Col([
             dbc.Button("Download Data", id="btn-download", n_clicks=0, className="btn-download", color="primary"),
-            dcc.Download(id="download-data")
+            dcc.Download(id="download-data"),
+            dbc.Button("CSV", id="btn-download-csv", external_link=True, className="btn-download", color="secondary"),
+            dbc.Button("Parquet", id="btn-download-parquet", external_link=True, className="btn-download", color="secondary",
+                       style={} if pa is not None else {'display': 'none'})
             # ], className="btn-column")
         ], className="date-picker-row"),
 
+        html.Div(id='range-totals', className="range-totals"),
+
         dbc.Row([
             dbc.Col([
                 dt.DataTable(id='datatable',
@@ -264,6 +760,14 @@ database_layout = {
                                 {"name": "Duration", "id": "duration"},
                                 {"name": "Status", "id": "status"}
                             ],
+                            page_action='custom',
+                            page_current=0,
+                            page_size=page_size,
+                            sort_action='custom',
+                            sort_mode='single',
+                            sort_by=[],
+                            filter_action='custom',
+                            filter_query='',
                             cell_selectable=False,
                             style_table={'bordered': True, 'marginBottom': '6rem'},  # Add border to the table
                             style_cell={'textAlign': 'center', 'color': 'white'},  # Center align the cell content
@@ -284,6 +788,8 @@ database_layout = {
                                 }
                             ],
                             data=[]),
+                dcc.Store(id='datatable-cursor'),
+                dcc.Interval(id='interval-table', interval=5000, n_intervals=0),
             ]),
         ]),
         button_group
@@ -324,12 +830,33 @@ oee_layout = {
             ], width=5, className="oee-col"),
         ], className="oee-row"),
 
+        dcc.Interval(id='interval-update-actual', interval=5000, n_intervals=0),
         button_group
     ], fluid=True, id="oee-page") for machine in machine_configs
 }
 
-initial_data = {
-    machine: {'run_seconds': 0, 'idle_seconds': 0, 'down_seconds': 0, 'total_time': 0, 'run_percent': 0, 'idle_percent': 0, 'down_percent': 0} for machine in machine_configs
+trend_layout = {
+    machine: dbc.Container([
+        html.Div(children=[
+            html.H1(machine.capitalize(), id="dashboard-title", className="mch-title")
+        ]),
+
+        dbc.Row([
+            dcc.DatePickerRange(
+                id='trend-date-range',
+                start_date=time.strftime("%Y-%m-%d", time.localtime(time.time() - 6 * 86400)),
+                end_date=time.strftime("%Y-%m-%d"),
+                display_format='DD MMMM YYYY',
+                minimum_nights=0,
+                className="date-picker"
+            ),
+        ], className="date-picker-row"),
+
+        html.Div(id='trend-utilization', className="range-totals"),
+        dcc.Store(id='trend-width'),
+        dcc.Loading(dcc.Graph(id='trend-graph', config={'displaylogo': False}, className="trend-graph")),
+        button_group
+    ], fluid=True, id="trend-page") for machine in machine_configs
 }
 
 app.layout = dbc.Container([
@@ -337,7 +864,8 @@ app.layout = dbc.Container([
         dbc.Button(html.I(className="bi bi-house-door"), href="/", id="home-btn", className="home-btn", color="primary"),
         html.H1("ISUZU Real-time Monitoring System", id='main-title')
     ]),
-    dcc.Store(id='monitor-store', storage_type='session', data=initial_data),
+    # Filled by assets/live.js from the /live event stream
+    dcc.Store(id='live-state', data={}),
     dcc.Location(id='url', refresh=False),
     html.Div(id='page-content'),
     dcc.Interval(id='interval-component', interval=1000, n_intervals=0),
@@ -347,10 +875,11 @@ app.layout = dbc.Container([
     [Output('url', 'pathname')],
     [Input('btn-dashboard', 'n_clicks'),
      Input('btn-database', 'n_clicks'),
-     Input('btn-oee', 'n_clicks')],
+     Input('btn-oee', 'n_clicks'),
+     Input('btn-trend', 'n_clicks')],
     [State('url', 'pathname')]
 )
-def update_url(btn_dashboard, btn_database, btn_oee, pathname):
+def update_url(btn_dashboard, btn_database, btn_oee, btn_trend, pathname):
     ctx = dash.callback_context
     if not ctx.triggered_id:
         button_id = 'btn-dashboard'
@@ -366,6 +895,8 @@ def update_url(btn_dashboard, btn_database, btn_oee, pathname):
         return [f'{current_path}/database']
     elif button_id == 'btn-oee':
         return [f'{current_path}/oee']
+    elif button_id == 'btn-trend':
+        return [f'{current_path}/trend']
 
 # Callback to update machine and display the corresponding dashboard_layout
 @app.callback([Output("page-content", "children"),
@@ -387,6 +918,9 @@ def display_page(pathname):
             elif pathname.endswith('/oee'):
                 if machine in oee_layout:
                     return oee_layout[machine], {'display': 'flex'}, {}
+            elif pathname.endswith('/trend'):
+                if machine in trend_layout:
+                    return trend_layout[machine], {'display': 'flex'}, {}
             else:
                 return dashboard_layouts[machine], {'display': 'flex'}, {}
     else:
@@ -396,20 +930,26 @@ def display_page(pathname):
 @app.callback(
     [Output('btn-dashboard', 'active'),
      Output('btn-database', 'active'),
-     Output('btn-oee', 'active')],
+     Output('btn-oee', 'active'),
+     Output('btn-trend', 'active')],
     [Input('url', 'pathname')]
 )
 def update_button_state(pathname):
     machine = pathname.split('/')[1]
 
     if pathname == f'/{machine}':
-        return True, False, False
+        return True, False, False, False
     elif pathname.endswith('/database'):
-        return False, True, False
+        return False, True, False, False
     elif pathname.endswith('/oee'):
-        return False, False, True
+        return False, False, True, False
+    elif pathname.endswith('/trend'):
+        return False, False, False, True
 
-@app.callback(
+# The clock, the running timers and the progress bars are rendered in the
+# browser (assets/live.js) from the pushed state; the interval never reaches the server
+app.clientside_callback(
+    ClientsideFunction(namespace='live', function_name='render_dashboard'),
     [Output('live-date', 'children'),
      Output('live-time', 'children'),
      Output('runtime-time', 'children'),
@@ -419,55 +959,118 @@ def update_button_state(pathname):
      Output('runtime-progress', 'value'),
      Output('idletime-progress', 'value'),
      Output('downtime-progress', 'value')],
-    [Input('monitor-store', 'data')],
+    [Input('interval-component', 'n_intervals'),
+     Input('live-state', 'data')],
     [State('url', 'pathname')]
 )
-def update_ui(data, pathname):
-    machine = pathname.split('/')[1]
-    date = time.strftime("%Y-%m-%d")
-    clock = time.strftime("%H:%M:%S")
-    runtime = data[machine]['run_seconds']
-    idletime = data[machine]['idle_seconds']
-    downtime = data[machine]['down_seconds']
-    total_time = data[machine]['total_time']
-    run_percent = data[machine]['run_percent']
-    idle_percent = data[machine]['idle_percent']
-    down_percent = data[machine]['down_percent']
-
-    return (date, clock, runtime, idletime, downtime, total_time, 
-            run_percent, idle_percent, down_percent)
-
-@app.callback( 
-    Output('monitor-store', 'data'),
-    [Input('interval-component', 'n_intervals')],
-    [State('monitor-store', 'data')])
-def store_data(n_intervals, data):
-    for mch in machine_configs:
-        monitor = machines[mch]
-        monitor.update_time()
-
-        runtime, idletime, downtime, total_time, run_percent, idle_percent, down_percent = monitor.get_time_data()
-        data[mch]['run_seconds'] = runtime
-        data[mch]['idle_seconds'] = idletime
-        data[mch]['down_seconds'] = downtime
-        data[mch]['total_time'] = total_time
-        data[mch]['run_percent'] = run_percent
-        data[mch]['idle_percent'] = idle_percent
-        data[mch]['down_percent'] = down_percent
-    return data
+
+# Each event carries the server time so clients can correct for clock skew
+def live_message(state):
+    return f'data: {{"server_time": {time.time()}, "state": {state}}}\n\n'
+
+# Server-sent events: the state of every machine on connect, then each change
+@app.server.route('/live')
+def live_events():
+    subscription = broadcaster.subscribe()
+
+    def stream():
+        try:
+            for state in snapshot_producer.current.machines.values():
+                yield live_message(state)
+            while True:
+                try:
+                    yield live_message(subscription.get(timeout=live_keepalive))
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            broadcaster.unsubscribe(subscription)
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def table_record(row):
+    return {'date': str(row[0]), 'start_time': str(row[1]), 'end_time': str(row[2]), 'duration': str(row[3]), 'status': row[4]}
+
+# New rows past the high-water mark, or open intervals on the visible page
+# that have closed, mean the page has to be fetched again
+def table_changed(monitor, cursor, start_date, end_date):
+    if cursor['open'] and monitor.fetch_closed_rows(cursor['open']):
+        return True
+    if end_date < time.strftime("%Y-%m-%d"):
+        return False
+    return monitor.has_rows_after(cursor['hwm'] or [start_date, '0:00:00', ''], end_date)
 
 # Define the callback to update the table content
 @app.callback(
-        Output('datatable', 'data'), 
-        [Input('interval-component', 'n_intervals'),
+        [Output('datatable', 'data'),
+         Output('datatable', 'page_count'),
+         Output('datatable-cursor', 'data')],
+        [Input('interval-table', 'n_intervals'),
+         Input('live-state', 'data'),
          Input('date-picker-range', 'start_date'),
+         Input('date-picker-range', 'end_date'),
+         Input('datatable', 'page_current'),
+         Input('datatable', 'sort_by'),
+         Input('datatable', 'filter_query')],
+        [State('datatable', 'page_size'),
+         State('datatable-cursor', 'data'),
+         State('url', 'pathname')])
+def update_table(n_intervals, states, start_date, end_date, page_current, sort_by, filter_query, page_size, cursor, pathname):
+    machine = pathname.split('/')[1]
+    monitor = machines[machine]
+    if not start_date or not end_date:
+        return [], 1, None
+
+    page_current = page_current or 0
+    query = [start_date, end_date, sort_by or [], filter_query or '']
+    conditions, params = parse_filter(filter_query)
+
+    if not cursor or cursor['query'] != query:
+        cursor = {'query': query, 'pages': {}, 'page': None, 'open': [],
+                  'hwm': monitor.fetch_last_key(end_date)}
+    elif cursor['page'] == page_current:
+        if not table_changed(monitor, cursor, start_date, end_date):
+            return no_update, no_update, no_update
+        # Results cached between the transition and its commit are stale now
+        monitor.invalidate()
+        # Inserted rows shift the start of later pages, so the known keys are dropped
+        cursor['pages'] = {}
+        cursor['hwm'] = monitor.fetch_last_key(end_date)
+
+    sort = sort_by[0] if sort_by else {'column_id': 'date', 'direction': 'asc'}
+    key_columns = sort_keys.get(sort['column_id'])
+    order_columns = key_columns or [sort['column_id'], 'date', 'start_time', 'status']
+    start_key = cursor['pages'].get(str(page_current)) if key_columns else None
+    offset = 0 if start_key is not None else page_current * page_size
+
+    rows = monitor.fetch_page(start_date, end_date, conditions, params, order_columns,
+                              sort['direction'] == 'desc', start_key, offset, page_size + 1)
+    records = [table_record(row) for row in rows[:page_size]]
+    if key_columns and records:
+        cursor['pages'][str(page_current)] = [records[0][column] for column in key_columns]
+        if len(rows) > page_size:
+            cursor['pages'][str(page_current + 1)] = [table_record(rows[page_size])[column] for column in key_columns]
+
+    cursor['page'] = page_current
+    cursor['open'] = [[record['date'], record['start_time'], record['status']] for record in records if record['duration'] == 'None']
+    # The row past the page tells whether a next page exists; the range is not
+    # counted, so the pager offers one page beyond the current one at most
+    page_count = page_current + 2 if len(rows) > page_size else page_current + 1
+    return records, page_count, cursor
+
+@app.callback(
+        Output('range-totals', 'children'),
+        [Input('date-picker-range', 'start_date'),
          Input('date-picker-range', 'end_date')],
         [State('url', 'pathname')])
-def update_table(n_intervals, start_date, end_date, pathname):
+def update_range_totals(start_date, end_date, pathname):
+    if not start_date or not end_date:
+        return ""
     machine = pathname.split('/')[1]
-    monitor = machines[machine]
-    data = monitor.fetch_data_from_mysql(start_date, end_date)
-    return [{'date': str(row[0]), 'start_time': str(row[1]), 'end_time': str(row[2]), 'duration': str(row[3]), 'status': row[4]} for row in data]
+    totals = machines[machine].fetch_range_totals(start_date, end_date)
+    return (f"Run {format_time(totals.get('RUNNING', 0))}  |  "
+            f"Idle {format_time(totals.get('IDLE', 0))}  |  "
+            f"Down {format_time(totals.get('DOWN', 0))}")
 
 @app.callback(
     Output("download-data", "data"),
@@ -481,14 +1084,81 @@ def download_data(n_clicks, start_date, end_date, pathname):
     if n_clicks:
         machine = pathname.split('/')[1]
         monitor = machines[machine]
-        data = monitor.fetch_data_from_mysql(start_date, end_date)
-        df = pd.DataFrame(data, columns=["date", "start_time", "end_time", "duration", "status"])
-        df['start_time'] = df['start_time'].apply(lambda x: str(x).split()[-1])
-        df['end_time'] = df['end_time'].apply(lambda x: str(x).split()[-1])
-        df['duration'] = df['duration'].apply(lambda x: str(x).split()[-1])
+        chunks = list(monitor.iter_export_chunks(start_date, end_date))
+        df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=export_columns)
         return dcc.send_data_frame(df.to_excel, filename=f"{machine}.xlsx", index=False)
     return None
 
+@app.callback(
+    [Output('btn-download-csv', 'href'),
+     Output('btn-download-parquet', 'href')],
+    [Input('date-picker-range', 'start_date'),
+     Input('date-picker-range', 'end_date')],
+    [State('url', 'pathname')])
+def update_export_links(start_date, end_date, pathname):
+    machine = pathname.split('/')[1]
+    query = f"start={start_date}&end={end_date}"
+    return f"/export/{machine}.csv?{query}", f"/export/{machine}.parquet?{query}"
+
+def stream_csv(chunks):
+    header = True
+    for df in chunks:
+        yield df.to_csv(index=False, header=header)
+        header = False
+
+# File-like sink that hands the Parquet writer's output back chunk by chunk
+class ParquetSink:
+    closed = False
+
+    def __init__(self):
+        self.buffer = []
+        self.position = 0
+
+    def write(self, data):
+        self.buffer.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self.buffer)
+        self.buffer = []
+        return data
+
+def stream_parquet(chunks):
+    sink = ParquetSink()
+    schema = pa.schema([(column, pa.string()) for column in export_columns])
+    writer = pq.ParquetWriter(sink, schema)
+    for df in chunks:
+        writer.write_table(pa.Table.from_pandas(df, schema=schema, preserve_index=False))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+# Stream a date range as CSV or Parquet, one row group / block per cursor chunk
+@app.server.route('/export/<machine>.<export_format>')
+def export_data(machine, export_format):
+    if machine not in machines or export_format not in ('csv', 'parquet'):
+        return Response("Unknown export", status=404)
+    if export_format == 'parquet' and pa is None:
+        return Response("Parquet export needs pyarrow", status=501)
+
+    chunks = machines[machine].iter_export_chunks(request.args.get('start'), request.args.get('end'))
+    if export_format == 'csv':
+        body, mimetype = stream_csv(chunks), 'text/csv'
+    else:
+        body, mimetype = stream_parquet(chunks), 'application/vnd.apache.parquet'
+    return Response(stream_with_context(body), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={machine}.{export_format}'})
+
 @app.callback(
     Output("download-oee", "data"),
     [Input("oee-download", "n_clicks"),
@@ -499,17 +1169,20 @@ def download_oee(n_clicks, pathname):
     if n_clicks:
         machine = pathname.split('/')[1]
         monitor = machines[machine]
-        data = monitor.fetch_oee_data()
-        df = pd.DataFrame(data, columns=["id", "date", "plan", "actual", "percentage"])
+        data = monitor.fetch_oee_export()
+        df = pd.DataFrame(data, columns=["id", "date", "plan", "actual", "percentage", "run_time", "idle_time", "down_time"])
+        for column in ["run_time", "idle_time", "down_time"]:
+            df[column] = df[column].map(format_time)
         return dcc.send_data_frame(df.to_excel, filename=f"{machine}.xlsx", index=False)
     return None
 
 @app.callback(
         [Output('andontable', 'data'), 
          Output('percentage', 'children')],
-        [Input('interval-update-actual', 'n_intervals')],
+        [Input('interval-update-actual', 'n_intervals'),
+         Input('live-state', 'data')],
         [State('url', 'pathname')])
-def update_andon(n_intervals, pathname):
+def update_andon(n_intervals, states, pathname):
     machine = pathname.split('/')[1]
     monitor = machines[machine]
     data = monitor.fetch_oee_data()
@@ -519,6 +1192,84 @@ def update_andon(n_intervals, pathname):
         percentage = row[4]
     return [{'plan': plan, 'actual': actual}], percentage 
 
+# The chart width in pixels sets how many points the server sends
+app.clientside_callback(
+    ClientsideFunction(namespace='live', function_name='chart_width'),
+    Output('trend-width', 'data'),
+    [Input('trend-date-range', 'start_date')]
+)
+
+# Slot length for a range drawn over `points` pixels, a whole number of buckets
+# of the coarsest rollup whose buckets are no longer than a slot, which reads
+# the fewest rows
+def trend_slots(start, end, points):
+    slot_seconds = max(60, -(-int((end - start).total_seconds()) // points))
+    table, bucket_seconds = trend_sources[0]
+    for candidate, seconds in trend_sources:
+        if seconds <= slot_seconds:
+            table, bucket_seconds = candidate, seconds
+    return table, -(-slot_seconds // bucket_seconds) * bucket_seconds
+
+# One bar per slot in the colour of the status that took most of it, and the
+# share of running time per slot
+def trend_figure(rows, start, slot_seconds):
+    slots = {}
+    for slot, status, seconds in rows:
+        slots.setdefault(int(slot), {})[status] = float(seconds)
+
+    timeline = {status: [] for status in trend_colors}
+    times, utilization = [], []
+    for slot in sorted(slots):
+        seconds = slots[slot]
+        moment = start + timedelta(seconds=slot * slot_seconds)
+        total = sum(seconds.get(status, 0) for status in trend_colors)
+        if total <= 0:
+            continue
+        timeline[max(trend_colors, key=lambda status: seconds.get(status, 0))].append(moment)
+        times.append(moment)
+        utilization.append(round(seconds.get('RUNNING', 0) / total * 100, 1))
+
+    figure = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.25, 0.75], vertical_spacing=0.05)
+    for status, color in trend_colors.items():
+        figure.add_trace(go.Bar(x=timeline[status], y=[1] * len(timeline[status]), width=slot_seconds * 1000,
+                                name=status.capitalize(), marker_color=color, hoverinfo='x+name'), row=1, col=1)
+    figure.add_trace(go.Scattergl(x=times, y=utilization, mode='lines', name='Utilization %',
+                                  line={'color': 'seagreen'}), row=2, col=1)
+    figure.update_yaxes(visible=False, row=1, col=1)
+    figure.update_yaxes(range=[0, 100], ticksuffix=' %', row=2, col=1)
+    figure.update_layout(barmode='overlay', bargap=0, template='plotly_dark', height=500,
+                         margin={'l': 50, 'r': 20, 't': 20, 'b': 30}, legend={'orientation': 'h'})
+    return figure
+
+# Trend of a date range from the rollups, downsampled in SQL to one slot per
+# chart pixel so a month never sends more than max_points slots. Open
+# intervals are not in the rollups yet and show up once they close
+@app.callback(
+    [Output('trend-graph', 'figure'),
+     Output('trend-utilization', 'children')],
+    [Input('trend-date-range', 'start_date'),
+     Input('trend-date-range', 'end_date'),
+     Input('trend-width', 'data')],
+    [State('url', 'pathname')])
+def update_trend(start_date, end_date, width, pathname):
+    if not start_date or not end_date or not width:
+        return no_update, no_update
+    machine = pathname.split('/')[1]
+    start = datetime.strptime(start_date[:10], "%Y-%m-%d")
+    end = datetime.strptime(end_date[:10], "%Y-%m-%d") + timedelta(days=1)
+    points = min(trend_config["max_points"], max(trend_config["min_points"], int(width)))
+
+    table, slot_seconds = trend_slots(start, end, points)
+    rows = machines[machine].fetch_trend(table, start, end, slot_seconds)
+
+    totals = {status: 0 for status in trend_colors}
+    for slot, status, seconds in rows:
+        if status in totals:
+            totals[status] += float(seconds)
+    total = sum(totals.values())
+    summary = f"Utilization {totals['RUNNING'] / total * 100:.1f} %" if total else "No closed intervals in this range"
+    return trend_figure(rows, start, slot_seconds), summary
+
 if __name__ == '__main__':
     try:
         app.run(debug=True, host='0.0.0.0', port=8080)
@@ -1,15 +1,110 @@
 import paho.mqtt.client as mqtt
-import paho.mqtt.publish as publish
 import mysql.connector
+from mysql.connector import errorcode
 import threading
 import time
+import json
+import os
+import zlib
+from collections import namedtuple
+from datetime import datetime, timedelta
+from shift_calendar import ShiftCalendar, default_shifts
+from machine_registry import machines, default_signals, machine_table, event_source, shared_events_table
+import schema
+import rollups
+from spool import Spool
+from db_health import DatabaseHealth
+import metrics
 
-# Machine configurations
-machines = {
-    "fanuc": {"cycle_time": 2.32, "topics": ["R01/ON", "R02/ON", "R12/OFF"]}
+mqttServer = "127.0.0.1"
+
+# One subscription covers every <machine>/<relay>/<state> topic
+topic_filter = "+/+/+"
+
+# Payloads may carry the time they were sent as "true|<epoch seconds>" (see
+# loadgen.py). The commit time and send times of such events are published
+# to ack_topic once they are written
+ack_topic = "ingest/ack"
+
+# Ingest writers: events are spooled to disk as they arrive and each of the
+# `workers` writer threads commits the events of its share of the machines once
+# batch_size of them are waiting or flush_interval seconds have passed. While
+# the database is healthy and more than max_queue_depth events are waiting,
+# the receive loop waits up to backpressure_timeout seconds per message. A
+# backlog left by an outage or a restart is replayed replay_batch_size at a
+# time. MySQL is pinged every health_check_interval seconds in the background;
+# while it is unreachable it is probed with a backoff from retry_delay up to
+# max_retry_delay seconds and the writer waits
+ingest_config = {
+    "workers": 4,
+    "batch_size": 200,
+    "flush_interval": 0.5,
+    "replay_batch_size": 5000,
+    "max_queue_depth": 10000,
+    "backpressure_timeout": 1,
+    "health_check_interval": 10,
+    "retry_delay": 1,
+    "max_retry_delay": 30,
+    "spool_path": os.path.join(os.path.dirname(os.path.abspath(__file__)), "ingest-spool.db"),
 }
 
-mqttServer = "127.0.0.1"
+Event = namedtuple("Event", ["machine", "status", "active", "timestamp", "sent"], defaults=(None,))
+
+# Ingest and OEE metrics, served in the Prometheus text format on
+# http://<host>:<port>/metrics
+metrics_config = {
+    "host": "127.0.0.1",
+    "port": 9108,
+}
+
+registry = metrics.Registry()
+messages_received = registry.counter("ingest_messages_total", "MQTT messages received")
+messages_unrouted = registry.counter("ingest_unrouted_messages_total", "Messages matching no machine signal")
+spool_append_seconds = registry.histogram("ingest_spool_append_seconds", "Time to append an event to the spool")
+backpressure_waits = registry.counter("ingest_backpressure_waits_total", "Messages held back because the queue was full")
+queue_depth = registry.gauge("ingest_queue_depth", "Events spooled and not yet written", lambda: spool.depth())
+database_available = registry.gauge("ingest_database_available", "1 while the database circuit is closed", lambda: int(health.available()))
+batch_events = registry.histogram("ingest_batch_events", "Events per written batch", (1, 10, 50, 100, 200, 500, 1000, 5000))
+write_seconds = registry.histogram("ingest_write_seconds", "Time to execute the statements of a batch")
+event_write_seconds = registry.histogram("ingest_event_write_seconds", "Statement time per event of a batch")
+commit_seconds = registry.histogram("ingest_commit_seconds", "Time to commit a batch")
+events_written = registry.counter("ingest_events_written_total", "Events committed to the database")
+events_dead_lettered = registry.counter("ingest_events_dead_lettered_total", "Events moved to the spool's dead letters after repeated write errors")
+write_errors = registry.counter("ingest_write_errors_total", "Failed batch writes by kind of error")
+reconnects = registry.counter("ingest_reconnects_total", "Writer connections reopened after a connection error")
+oee_pass_seconds = registry.histogram("oee_pass_seconds", "Time of one scheduler pass over all machines")
+oee_calculate_seconds = registry.histogram("oee_calculate_seconds", "Time of calculate_oee per machine")
+oee_writes = registry.counter("oee_writes_total", "Upserts of the oee table")
+oee_errors = registry.counter("oee_errors_total", "Scheduler passes that failed on a database error")
+
+# Dispatch table from (machine, signal, payload) to (status, active), and the
+# insert/update statements of each machine's table, built once from the registry
+def build_routes(machines):
+    routes = {}
+    for machine, config in machines.items():
+        for signal, status in config.get("signals", default_signals).items():
+            routes[(machine, signal, "true")] = (status, True)
+            routes[(machine, signal, "false")] = (status, False)
+    return routes
+
+def build_statements(machines):
+    statements = {}
+    for machine in machines:
+        table = machine_table(machine)
+        if table == shared_events_table:
+            statements[machine] = {
+                True: f"INSERT INTO {table} (date, start_time, status, machine_id) VALUES (%s, %s, %s, %s)",
+                False: f"UPDATE {table} SET end_time = %s, duration = TIMEDIFF(%s, start_time) WHERE id = %s AND date = %s",
+            }
+        else:
+            statements[machine] = {
+                True: f"INSERT INTO {table} (date, start_time, status) VALUES (%s, %s, %s)",
+                False: f"UPDATE {table} SET end_time = %s, duration = TIMEDIFF(%s, start_time) WHERE id = %s",
+            }
+    return statements
+
+routes = build_routes(machines)
+statements = build_statements(machines)
 
 db_config = {
     "host": "localhost",
@@ -18,120 +113,516 @@ db_config = {
     "database": "machine"
 }
 
-connection = mysql.connector.connect(**db_config)
-cursor = connection.cursor()
+# Connection of the OEE scheduler, opened by prepare_database()
+connection = None
+cursor = None
 
 def on_connect(client, userdata, flags, rc):
     print("Connected with result code " + str(rc))
-    for machine, config in machines.items():
-        for topic in config["topics"]:
-            client.subscribe(f"{machine}/{topic}")
+    client.subscribe(topic_filter)
 
 def on_message(client, userdata, msg):
     print(f"{msg.topic}: {msg.payload.decode()}")
-    process_message(msg)
+    ingest_message(msg)
 
-def reconnect_db():
-    global connection, cursor
+# Spool one relay message. `received` replaces the time of receipt when a
+# capture is replayed with its original timestamps (see replay.py)
+def ingest_message(msg, received=None):
+    messages_received.inc()
+    event = parse_message(msg, received)
+    if event is None:
+        messages_unrouted.inc()
+        return
+    # Slow the receive loop down while the writers fall behind a healthy database;
+    # during an outage the spool takes everything
+    if health.available() and spool.depth() >= ingest_config["max_queue_depth"]:
+        print(f"Ingest queue depth {spool.depth()}, applying backpressure")
+        backpressure_waits.inc()
+        spool.wait_below(ingest_config["max_queue_depth"], ingest_config["backpressure_timeout"])
+    with spool_append_seconds.time():
+        spool.append(event)
+
+def parse_message(msg, received=None):
+    machine, signal = msg.topic.split("/", 1)
+    value, _, sent = msg.payload.decode().partition("|")
+    route = routes.get((machine, signal, value))
+    if route is None:
+        return None
     try:
-        connection.ping(reconnect=True, attempts=3, delay=5)
-    except mysql.connector.Error as err:
-        print(f"Error reconnecting to database: {err}")
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor()
+        sent = float(sent) if sent else None
+    except ValueError:
+        sent = None
+    return Event(machine, route[0], route[1], (received or datetime.now()).replace(microsecond=0), sent)
 
-def process_message(msg):
-    reconnect_db()
-    machine, topic = msg.topic.split("/", 1)
-    c = msg.payload.decode()
-    if topic == "R01/ON":
-        if c == "true":
-            qry = "INSERT INTO fanuc (date, start_time, status) VALUES (CURDATE(), CURTIME(), 'RUNNING')"
-        else:
-            qry = "UPDATE fanuc SET end_time = CURTIME(), duration = TIMEDIFF(CURTIME(), start_time) WHERE duration IS NULL AND status = 'RUNNING'"
-    elif topic == "R02/ON":
-        if c == "true":
-            qry = "INSERT INTO fanuc (date, start_time, status) VALUES (CURDATE(), CURTIME(), 'DOWN')"
-        else:
-            qry = "UPDATE fanuc SET end_time = CURTIME(), duration = TIMEDIFF(CURTIME(), start_time) WHERE duration IS NULL AND status = 'DOWN'"
-    elif topic == "R12/OFF":
-        if c == "true":
-            qry = "INSERT INTO fanuc (date, start_time, status) VALUES (CURDATE(), CURTIME(), 'IDLE')"
+# Open interval of each (machine, status) as the (id, date, start) of its row,
+# so a stop closes exactly the row its start inserted
+open_intervals = {}
+
+def insert_params(event):
+    params = (event.timestamp.date(), event.timestamp.time(), event.status)
+    if machine_table(event.machine) == shared_events_table:
+        params += (event.machine,)
+    return params
+
+def close_params(event, row):
+    row_id, row_date, start = row
+    if machine_table(event.machine) == shared_events_table:
+        return (event.timestamp.time(), event.timestamp.time(), row_id, row_date)
+    return (event.timestamp.time(), event.timestamp.time(), row_id)
+
+# The open row of (machine, status) as of the events written so far in the batch
+def open_row(opened, key):
+    return opened[key] if key in opened else open_intervals.get(key)
+
+def write_run(cursor, run, opened, closed):
+    machine = run[0].machine
+    if run[0].active:
+        # A repeated start (after a controller reboot or a lost stop) continues
+        # the open interval; a second row would never be closed
+        starts = []
+        starting = set()
+        for event in run:
+            key = (machine, event.status)
+            if key in starting or open_row(opened, key) is not None:
+                print(f"{event.status} interval of {machine} is already open, ignoring the start")
+                continue
+            starting.add(key)
+            starts.append(event)
+        if not starts:
+            return
+        cursor.executemany(statements[machine][True], [insert_params(event) for event in starts])
+        # A multi-row INSERT takes consecutive ids starting at lastrowid
+        for offset, event in enumerate(starts):
+            opened[(machine, event.status)] = (cursor.lastrowid + offset, event.timestamp.date(), event.timestamp)
+        return
+
+    params = []
+    for event in run:
+        key = (machine, event.status)
+        row = open_row(opened, key)
+        opened[key] = None
+        if row is None:
+            print(f"No open {event.status} interval of {machine} to close")
+            continue
+        params.append(close_params(event, row))
+        closed.append((machine, event.status, row[2], event.timestamp))
+    if params:
+        cursor.executemany(statements[machine][False], params)
+
+# Returns the open-interval changes of the batch, to apply once it is committed.
+# Closed intervals are added to the rollups in the same transaction
+def write_batch(cursor, batch):
+    # Consecutive events for the same statement go out in one executemany, so
+    # the order of starts and stops within the batch is kept
+    opened = {}
+    closed = []
+    run = []
+    for event in batch:
+        if run and (run[-1].machine, run[-1].active) != (event.machine, event.active):
+            write_run(cursor, run, opened, closed)
+            run = []
+        run.append(event)
+    if run:
+        write_run(cursor, run, opened, closed)
+    if closed:
+        rollups.add_intervals(cursor, closed)
+    return opened
+
+def apply_opened(opened):
+    for key, row in opened.items():
+        if row is None:
+            open_intervals.pop(key, None)
         else:
-            qry = "UPDATE fanuc SET end_time = CURTIME(), duration = TIMEDIFF(CURTIME(), start_time) WHERE duration IS NULL AND status = 'IDLE'"
+            open_intervals[key] = row
 
-    cursor.execute(qry)
+# Rebuild open_intervals (and the start of open RUNNING intervals) from the
+# rows that have no duration yet, newest first
+def load_open_intervals(connection):
+    cursor = connection.cursor()
+    for machine, config in machines.items():
+        table, machine_where, machine_params = event_source(machine)
+        statuses = sorted(set(config.get("signals", default_signals).values()))
+        placeholders = ", ".join(["%s"] * len(statuses))
+        cursor.execute(
+            f"SELECT id, date, start_time, status FROM {table} "
+            f"WHERE {machine_where}status IN ({placeholders}) AND duration IS NULL ORDER BY id DESC",
+            machine_params + tuple(statuses)
+        )
+        for row_id, row_date, start_time, status in cursor.fetchall():
+            if (machine, status) in open_intervals:
+                continue
+            start = datetime.combine(row_date, datetime.min.time()) + start_time
+            open_intervals[(machine, status)] = (row_id, row_date, start)
+            if status == "RUNNING":
+                running_since[machine] = start
     connection.commit()
+    cursor.close()
+
+# The oldest spooled events of a worker's machines and their sequence numbers
+def next_batch(worker_machines):
+    if spool.wait(worker_machines) < ingest_config["batch_size"]:
+        spool.wait(worker_machines, ingest_config["batch_size"], ingest_config["flush_interval"])
+    rows = spool.read(worker_machines, ingest_config["replay_batch_size"])
+    return [row[0] for row in rows], [Event(*row[1:]) for row in rows]
+
+# Every machine belongs to one worker, so its events are written in order while
+# different machines are written in parallel
+def assign_workers(machines, workers):
+    assignment = [[] for _ in range(workers)]
+    for machine in sorted(machines):
+        assignment[zlib.crc32(machine.encode()) % workers].append(machine)
+    return [worker_machines for worker_machines in assignment if worker_machines]
+
+# A RUNNING interval counts towards OEE "actual" once it lasted this long
+min_cycle_seconds = 120
+
+# Per-machine OEE counts for the current day. The writer counts closed
+# RUNNING intervals as they are committed; the oee table is only written
+# when plan or actual change
+oee_state = {}
+oee_lock = threading.Lock()
+running_since = {}
+
+# Set whenever the scheduler has something to do before its next boundary
+wakeup = threading.Event()
+
+def count_closed_cycles(batch):
+    for event in batch:
+        if event.status != "RUNNING":
+            continue
+        if event.active:
+            # write_run ignores a repeated start, so the first one is kept
+            running_since.setdefault(event.machine, event.timestamp)
+            continue
+        start = running_since.pop(event.machine, None)
+        state = oee_state.get(event.machine)
+        if start is None or state is None or state["date"] != start.date():
+            continue
+        if (event.timestamp - start).total_seconds() >= min_cycle_seconds:
+            state["actual"] += 1
+            wakeup.set()
+
+def publish_ack(batch):
+    sent = [event.sent for event in batch if event.sent is not None]
+    if sent:
+        client.publish(ack_topic, payload=json.dumps({"committed": time.time(), "sent": sent}))
+
+def rollback_quietly(connection):
+    if connection is None:
+        return
+    try:
+        connection.rollback()
+    except mysql.connector.Error:
+        pass
+
+def close_quietly(connection):
+    if connection is None:
+        return
+    try:
+        connection.close()
+    except mysql.connector.Error:
+        pass
+
+# Write and commit a batch, then apply its open-interval changes and OEE counts
+def commit_batch(connection, batch):
+    cursor = connection.cursor()
+    started = time.perf_counter()
+    opened = write_batch(cursor, batch)
+    written = time.perf_counter()
+    with oee_lock:
+        connection.commit()
+        apply_opened(opened)
+        count_closed_cycles(batch)
+    committed = time.perf_counter()
+    cursor.close()
+    publish_ack(batch)
+    write_seconds.observe(written - started)
+    event_write_seconds.observe((written - started) / len(batch))
+    commit_seconds.observe(committed - written)
+    batch_events.observe(len(batch))
+    events_written.inc(len(batch))
+
+# Writers start with the ingest but wait for prepare_database; their connection
+# is opened on the first batch and reopened after connection errors. A batch
+# failing twice on anything but the connection or a deadlock is written again
+# one event at a time, and an event failing twice on its own goes to the
+# spool's dead letters. Events leave the spool only once they are committed
+def writer_thread_func(worker_machines):
+    database_ready.wait()
+    connection = None
+    connected = False
+    while True:
+        seqs, batch = next_batch(worker_machines)
+        parts = [(seqs, batch)]
+        attempts = 0
+        while parts:
+            part_seqs, part = parts[0]
+            if not health.available():
+                health.wait_available()
+            try:
+                if connection is None:
+                    connection = mysql.connector.connect(**db_config)
+                    if connected:
+                        reconnects.inc()
+                    connected = True
+                commit_batch(connection, part)
+                spool.ack(worker_machines, part_seqs[-1])
+                parts.pop(0)
+                attempts = 0
+            except (mysql.connector.InterfaceError, mysql.connector.OperationalError) as err:
+                # MySQL is unreachable: the batch stays spooled until the
+                # health monitor sees it back, then goes out on a new connection
+                print(f"{len(part)} events kept in the spool: {err}")
+                write_errors.inc(kind="connection")
+                health.report_failure(err)
+                close_quietly(connection)
+                connection = None
+            except mysql.connector.Error as err:
+                print(f"Error writing {len(part)} events: {err}")
+                rollback_quietly(connection)
+                # Workers writing the shared tables can deadlock each other; that is retried
+                if err.errno in (errorcode.ER_LOCK_DEADLOCK, errorcode.ER_LOCK_WAIT_TIMEOUT):
+                    write_errors.inc(kind="deadlock")
+                    continue
+                write_errors.inc(kind="other")
+                attempts += 1
+                if attempts < 2:
+                    continue
+                attempts = 0
+                parts.pop(0)
+                if len(part) > 1:
+                    print(f"Writing {len(part)} events one at a time")
+                    parts[:0] = [([seq], [event]) for seq, event in zip(part_seqs, part)]
+                else:
+                    print(f"Moving {part[0]} to the dead letters")
+                    spool.dead_letter(part_seqs[0], str(err))
+                    events_dead_lettered.inc()
 
 def mqtt_thread_func():
-    client = mqtt.Client()
     client.on_connect = on_connect
     client.on_message = on_message
     client.connect(mqttServer, 1883, 0)
     client.loop_forever()
 
-mqtt_thread = threading.Thread(target=mqtt_thread_func)
-mqtt_thread.start()
+# Opened by start(), so callers can point spool_path elsewhere first
+spool = None
 
-seconds = 0
+health = DatabaseHealth(db_config, ingest_config["health_check_interval"], ingest_config["retry_delay"], ingest_config["max_retry_delay"])
 
-def calculate_oee(machine):
-    global seconds
-    config = machines[machine]
-    plan = 0
+# One persistent client receives the relay topics and sends end-of-shift resets
+client = mqtt.Client()
 
-    # Get plan from the oee table
-    cursor.execute("SELECT plan FROM oee WHERE date = CURDATE() AND id = %s", (machine,))
-    result = cursor.fetchone()
+# Set once the schema is migrated and the open intervals are loaded. The
+# writers and the scheduler wait for it; events are spooled before that
+database_ready = threading.Event()
+
+# Migrate the schema and load the open intervals on the scheduler connection,
+# retried until the database is reachable
+def prepare_database():
+    global connection, cursor
+    while True:
+        health.wait_available()
+        try:
+            connection = mysql.connector.connect(**db_config)
+            schema.migrate(connection)
+            cursor = connection.cursor()
+            open_intervals.clear()
+            running_since.clear()
+            load_open_intervals(connection)
+            break
+        except mysql.connector.Error as err:
+            print(f"Cannot prepare the database: {err}")
+            if isinstance(err, (mysql.connector.InterfaceError, mysql.connector.OperationalError)):
+                health.report_failure(err)
+            close_quietly(connection)
+            connection = None
+            time.sleep(ingest_config["retry_delay"])
+    database_ready.set()
+    wakeup.set()
 
-    if result and result[0] is not None:
-        plan = int(result[0])
-    else:
-        plan = 0
+# Start spooling: the MQTT receive loop, unless messages are fed in through
+# ingest_message directly, and the writers, which begin once prepare_database
+# has reached the database
+def start(receive=True):
+    global spool
+    spool = Spool(ingest_config["spool_path"])
+    health.start()
+    metrics.serve(registry, metrics_config["host"], metrics_config["port"])
+    threading.Thread(target=prepare_database, daemon=True).start()
+
+    writer_threads = [
+        threading.Thread(target=writer_thread_func, args=(worker_machines,), daemon=True)
+        for worker_machines in assign_workers(machines, ingest_config["workers"])
+    ]
+    for writer_thread in writer_threads:
+        writer_thread.start()
+
+    if receive:
+        mqtt_thread = threading.Thread(target=mqtt_thread_func)
+        mqtt_thread.start()
+
+# The scheduler can sleep for hours between passes, longer than the server keeps
+# an idle connection, so its connection is pinged before each pass and reopened
+# when that fails. Returns False while the database cannot be reached
+def ensure_scheduler_connection():
+    global connection, cursor
+    if not database_ready.is_set() or not health.available():
+        return False
+    try:
+        if connection is not None:
+            try:
+                connection.ping()
+                return True
+            except mysql.connector.Error:
+                drop_scheduler_connection()
+        connection = mysql.connector.connect(**db_config)
+        cursor = connection.cursor()
+        return True
+    except mysql.connector.Error as err:
+        print(f"OEE scheduler cannot reach the database: {err}")
+        health.report_failure(err)
+        return False
 
-    if seconds % int(config["cycle_time"] * 60) == 0:
-        plan += 1
+def drop_scheduler_connection():
+    global connection
+    close_quietly(connection)
+    connection = None
 
-    # Get actual count from the fanuc table
-    cursor.execute("SELECT COUNT(*) FROM fanuc WHERE date = CURDATE() AND status = 'RUNNING' AND duration IS NOT NULL AND duration >= '00:02:00'")
+# Plan ticks not yet added to oee_state, per machine as (day, ticks). They are
+# kept while the database is unreachable, since today's state may first have
+# to be loaded from it
+pending_ticks = {}
+
+def queue_ticks(machine, today, ticks):
+    day, pending = pending_ticks.get(machine, (today, 0))
+    pending_ticks[machine] = (today, (pending if day == today else 0) + ticks)
+
+# Load today's plan and actual from the database, at startup and at day rollover
+def reconcile_oee(machine, today):
+    connection.commit()  # start from a fresh snapshot
+    cursor.execute("SELECT plan, actual FROM oee WHERE date = %s AND id = %s", (today, machine))
+    result = cursor.fetchone()
+    plan = int(result[0]) if result and result[0] is not None else 0
+
+    table, machine_where, machine_params = event_source(machine)
+    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE {machine_where}date = %s AND status = 'RUNNING' AND duration IS NOT NULL AND duration >= '00:02:00'", machine_params + (today,))
     actual = cursor.fetchone()[0]
 
+    # Without a row for today (after midnight) nothing is persisted yet, so the
+    # next pass writes it even before the first plan tick
+    persisted = (plan, int(result[1] or 0)) if result else None
+    oee_state[machine] = {"date": today, "plan": plan, "actual": actual, "persisted": persisted}
+
+# Add the queued plan ticks and write plan and actual when they changed. A
+# database error leaves the ticks queued or the change unpersisted, so the
+# next pass picks it up again
+def calculate_oee(machine, today):
+    with oee_lock:
+        state = oee_state.get(machine)
+        if state is None or state["date"] != today:
+            reconcile_oee(machine, today)
+            state = oee_state[machine]
+
+        day, ticks = pending_ticks.pop(machine, (today, 0))
+        state["plan"] += ticks if day == today else 0
+        plan, actual = state["plan"], state["actual"]
+        if (plan, actual) == state["persisted"]:
+            return
+
     percent = (actual / plan) * 100 if plan > 0 else 0
     percentage = f"{percent:.2f} %"
 
     cursor.execute(
-        "INSERT INTO oee (id, date, plan, actual, percentage) VALUES (%s, CURDATE(), %s, %s, %s) "
+        "INSERT INTO oee (id, date, plan, actual, percentage) VALUES (%s, %s, %s, %s, %s) "
         "ON DUPLICATE KEY UPDATE actual = %s, plan = %s, percentage = %s",
-        (machine, plan, actual, percentage, actual, plan, percentage)
+        (machine, today, plan, actual, percentage, actual, plan, percentage)
     )
 
     connection.commit()
+    state["persisted"] = (plan, actual)
+    oee_writes.inc()
 
-while True:
-    for machine in machines.keys():
-        calculate_oee(machine)
-    
-    current_time = int(time.strftime("%H%M"))
-    current_day = int(time.strftime("%w"))
-
-    time_periods = [
-        (740, 1000),
-        (1010, 1145 if current_day == 5 else 1200),
-        (1300 if current_day == 5 else 1245, 1415),
-        (1425, 1545 if current_day == 5 else 1615),
-        (1630 if current_day == 5 else 0, 1645 if current_day == 5 else 0)
-    ]
+calendars = {machine: ShiftCalendar(config.get("shifts", default_shifts)) for machine, config in machines.items()}
+
+# Working second of the next plan tick per machine, and the day of the last reset
+next_ticks = {}
+resets_done = {}
+
+# Plan ticks fall every cycle_time minutes of working time, starting at the first
+# window of the day. Returns the ticks that are due and the time of the next one
+def plan_ticks_due(machine, now):
+    calendar = calendars[machine]
+    cycle = int(machines[machine]["cycle_time"] * 60)
+    today = now.date()
+
+    day, next_tick = next_ticks.get(machine, (None, 0))
+    if day != today:
+        # Continue today's tick phase after a restart instead of ticking at once
+        elapsed = calendar.shift_seconds(today, now)
+        next_tick = -(-int(elapsed) // cycle) * cycle if day is None else 0
+
+    ticks = 0
+    due = calendar.time_at(today, next_tick)
+    while due is not None and due <= now:
+        ticks += 1
+        next_tick += cycle
+        due = calendar.time_at(today, next_tick)
+
+    next_ticks[machine] = (today, next_tick)
+    return ticks, due
+
+def publish_resets(reset_machines):
+    for machine in reset_machines:
+        for signal in machines[machine].get("signals", default_signals):
+            client.publish(f"{machine}/{signal}", payload="false")
+
+# Sleep until the next plan tick, end of shift or day rollover; the writer wakes
+# the scheduler early when an OEE count changes. While the database is
+# unreachable the pass is retried every health_check_interval seconds
+def run_scheduler():
+    while True:
+        now = datetime.now()
+        today = now.date()
+        wake_at = [datetime.combine(today + timedelta(days=1), datetime.min.time())]
+        due_resets = []
+        started = time.perf_counter()
+        database_ok = ensure_scheduler_connection()
+
+        for machine in machines:
+            ticks, next_tick_at = plan_ticks_due(machine, now)
+            queue_ticks(machine, today, ticks)
+            if database_ok:
+                try:
+                    with oee_calculate_seconds.time():
+                        calculate_oee(machine, today)
+                except mysql.connector.Error as err:
+                    print(f"Error updating the OEE of {machine}: {err}")
+                    oee_errors.inc()
+                    drop_scheduler_connection()
+                    database_ok = False
+            if next_tick_at is not None:
+                wake_at.append(next_tick_at)
+
+            shift_end = calendars[machine].shift_end(today)
+            if machine not in resets_done:
+                resets_done[machine] = today if shift_end is not None and shift_end <= now else None
+            if shift_end is None or resets_done[machine] == today:
+                continue
+            if shift_end <= now:
+                due_resets.append(machine)
+                resets_done[machine] = today
+            else:
+                wake_at.append(shift_end)
 
-    in_time_period = any(start <= current_time < end for start, end in time_periods)
+        if due_resets:
+            publish_resets(due_resets)
+        oee_pass_seconds.observe(time.perf_counter() - started)
+        if not database_ok:
+            wake_at.append(datetime.now() + timedelta(seconds=ingest_config["health_check_interval"]))
 
-    if in_time_period:
-        time.sleep(1)
-        seconds += 1
+        wakeup.wait(max(0, (min(wake_at) - datetime.now()).total_seconds()))
+        wakeup.clear()
 
-    if ((current_time == 1615 and current_day != 5) or
-        (current_time == 1645 and current_day == 5)):
-        for machine, config in machines.items():
-            for topic in config["topics"]:
-                publish.single(f"{machine}/{topic}", payload="false", hostname=mqttServer)
-        time.sleep(60)  # Delay for a minute to avoid publishing multiple times
- 
\ No newline at end of file
+if __name__ == "__main__":
+    start()
+    run_scheduler()
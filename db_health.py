@@ -0,0 +1,72 @@
+import mysql.connector
+import threading
+import time
+
+# Circuit breaker over the MySQL connection. The writer checks `available()`
+# before each batch and reports execute failures; a background thread pings
+# the server every check_interval seconds while the circuit is closed and, once
+# it is open, probes with a backoff from retry_delay up to max_retry_delay
+# seconds until the server answers again
+class DatabaseHealth:
+    def __init__(self, db_config, check_interval=10, retry_delay=1, max_retry_delay=30):
+        self.db_config = db_config
+        self.check_interval = check_interval
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self.healthy = True
+        self.lock = threading.Lock()
+        self.failed = threading.Event()
+        self.recovered = threading.Event()
+        self.recovered.set()
+        self.connection = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def available(self):
+        return self.healthy
+
+    def wait_available(self, timeout=None):
+        return self.recovered.wait(timeout)
+
+    def report_failure(self, err):
+        with self.lock:
+            if self.healthy:
+                print(f"Database unavailable: {err}")
+            self.healthy = False
+            self.recovered.clear()
+            self.failed.set()
+
+    def ping(self):
+        try:
+            if self.connection is None:
+                self.connection = mysql.connector.connect(**self.db_config, connection_timeout=5)
+            else:
+                self.connection.ping()
+            return True
+        except mysql.connector.Error:
+            if self.connection is not None:
+                try:
+                    self.connection.close()
+                except mysql.connector.Error:
+                    pass
+            self.connection = None
+            return False
+
+    def run(self):
+        while True:
+            if self.healthy:
+                if not self.failed.wait(self.check_interval) and not self.ping():
+                    self.report_failure("health check failed")
+                continue
+
+            delay = self.retry_delay
+            while not self.ping():
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+            with self.lock:
+                self.healthy = True
+                self.failed.clear()
+                self.recovered.set()
+            print("Database available again")
@@ -0,0 +1,63 @@
+import argparse
+import json
+import threading
+import time
+import paho.mqtt.client as mqtt
+
+mqttServer = "127.0.0.1"
+
+# Topic database.py publishes the commit and send times of written events to
+ack_topic = "ingest/ack"
+
+latencies = []
+window = []
+lock = threading.Lock()
+
+def on_connect(client, userdata, flags, rc):
+    client.subscribe(ack_topic)
+
+def on_message(client, userdata, msg):
+    ack = json.loads(msg.payload)
+    batch = [ack["committed"] - sent for sent in ack["sent"]]
+    with lock:
+        latencies.extend(batch)
+        window.extend(batch)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summary(values, seconds):
+    if not values:
+        return "no events written"
+    return (f"{len(values)} events, {len(values) / seconds:.1f}/s, "
+            f"p50 {percentile(values, 0.5) * 1000:.0f} ms, p99 {percentile(values, 0.99) * 1000:.0f} ms, "
+            f"max {max(values) * 1000:.0f} ms")
+
+# Publish-to-commit latency of the events loadgen.py sends through database.py.
+# Both sides take time.time(), so run them on hosts with synchronised clocks
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report ingest throughput and publish-to-database latency")
+    parser.add_argument("--interval", type=float, default=5, help="seconds between reports")
+    parser.add_argument("--duration", type=float, default=0, help="seconds, 0 runs until interrupted")
+    args = parser.parse_args()
+
+    client = mqtt.Client()
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.connect(mqttServer, 1883, 60)
+    client.loop_start()
+
+    started = time.monotonic()
+    try:
+        while args.duration <= 0 or time.monotonic() - started < args.duration:
+            time.sleep(args.interval)
+            with lock:
+                values = window[:]
+                window.clear()
+            print(summary(values, args.interval))
+    except KeyboardInterrupt:
+        pass
+    client.loop_stop()
+    with lock:
+        print("Total: " + summary(latencies, time.monotonic() - started))
@@ -0,0 +1,102 @@
+import argparse
+import json
+import random
+import time
+import paho.mqtt.client as mqtt
+from machine_registry import default_signals, shared_events_table
+
+mqttServer = "127.0.0.1"
+
+# Simulated machines move between statuses like the real relays do: the
+# current status is switched off, then the next one on. Weights of the next
+# status after each status
+transitions = {
+    "RUNNING": {"IDLE": 0.7, "DOWN": 0.3},
+    "IDLE": {"RUNNING": 0.9, "DOWN": 0.1},
+    "DOWN": {"RUNNING": 0.6, "IDLE": 0.4},
+}
+
+signal_of = {status: signal for signal, status in default_signals.items()}
+
+def machine_names(count, prefix):
+    return [f"{prefix}{number:03d}" for number in range(1, count + 1)]
+
+# Registry for database.py (MACHINE_REGISTRY=<path>) covering the simulated machines
+def write_registry(path, names, cycle_time):
+    with open(path, "w") as f:
+        json.dump({name: {"cycle_time": cycle_time, "table": shared_events_table} for name in names}, f, indent=2)
+
+class SimulatedMachine:
+    def __init__(self, name):
+        self.name = name
+        self.status = None
+
+    # (topic, value) messages that move the machine to its next status
+    def step(self):
+        messages = []
+        if self.status is None:
+            next_status = "RUNNING"
+        else:
+            choices = transitions[self.status]
+            next_status = random.choices(list(choices), weights=list(choices.values()))[0]
+            messages.append((f"{self.name}/{signal_of[self.status]}", "false"))
+        messages.append((f"{self.name}/{signal_of[next_status]}", "true"))
+        self.status = next_status
+        return messages
+
+    def stop(self):
+        if self.status is None:
+            return []
+        messages = [(f"{self.name}/{signal_of[self.status]}", "false")]
+        self.status = None
+        return messages
+
+def publish(client, messages):
+    for topic, value in messages:
+        client.publish(topic, payload=f"{value}|{time.time():.6f}")
+    return len(messages)
+
+# Publish about `rate` messages per second over one client, spread over the
+# machines at random, for `duration` seconds (0 runs until interrupted)
+def run(client, machines, rate, duration):
+    started = time.monotonic()
+    next_send = started
+    reported = started
+    sent = 0
+    try:
+        while duration <= 0 or time.monotonic() - started < duration:
+            sent += publish(client, random.choice(machines).step())
+            next_send += 2 / rate
+            now = time.monotonic()
+            if now - reported >= 5:
+                print(f"Sent {sent} messages, {sent / (now - started):.1f}/s")
+                reported = now
+            if next_send > now:
+                time.sleep(next_send - now)
+    except KeyboardInterrupt:
+        pass
+    # Close the open intervals so the run leaves no open rows behind
+    for machine in machines:
+        sent += publish(client, machine.stop())
+    print(f"Sent {sent} messages in {time.monotonic() - started:.1f} s")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulate relay messages of many machines; measure with loadcheck.py")
+    parser.add_argument("--machines", type=int, default=50)
+    parser.add_argument("--rate", type=float, default=100, help="messages per second over all machines")
+    parser.add_argument("--duration", type=float, default=60, help="seconds, 0 runs until interrupted")
+    parser.add_argument("--prefix", default="sim")
+    parser.add_argument("--cycle-time", type=float, default=2.32)
+    parser.add_argument("--write-registry", metavar="PATH", help="write a machine registry for the simulated machines and exit")
+    args = parser.parse_args()
+
+    names = machine_names(args.machines, args.prefix)
+    if args.write_registry:
+        write_registry(args.write_registry, names, args.cycle_time)
+    else:
+        client = mqtt.Client()
+        client.connect(mqttServer, 1883, 60)
+        client.loop_start()
+        run(client, [SimulatedMachine(name) for name in names], args.rate, args.duration)
+        client.loop_stop()
+        client.disconnect()
@@ -0,0 +1,39 @@
+import json
+import os
+
+# Relay topics under each machine and the status they switch
+default_signals = {"R01/ON": "RUNNING", "R02/ON": "DOWN", "R12/OFF": "IDLE"}
+
+# Machines that share the partitioned events table instead of a table of their own
+shared_events_table = "events"
+
+# Machine registry. A machine may set "table" (defaults to its name, or
+# shared_events_table), "signals" (defaults to default_signals) and "shifts"
+# ({weekday: [(HHMM, HHMM), ...]}, defaults to default_shifts). A machines.json
+# file next to this module, or the file named by MACHINE_REGISTRY, replaces the
+# built-in registry
+machines = {
+    "fanuc": {"cycle_time": 2.32}
+}
+
+def load_machines(path):
+    with open(path) as f:
+        registry = json.load(f)
+    for config in registry.values():
+        if "shifts" in config:
+            config["shifts"] = {int(weekday): [tuple(window) for window in windows] for weekday, windows in config["shifts"].items()}
+    return registry
+
+def machine_table(machine):
+    return machines[machine].get("table", machine)
+
+# Table, extra WHERE clause and parameters selecting one machine's events
+def event_source(machine):
+    table = machine_table(machine)
+    if table == shared_events_table:
+        return table, "machine_id = %s AND ", (machine,)
+    return table, "", ()
+
+registry_file = os.environ.get("MACHINE_REGISTRY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "machines.json"))
+if os.path.exists(registry_file):
+    machines = load_machines(registry_file)
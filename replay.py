@@ -0,0 +1,162 @@
+import argparse
+import gzip
+import os
+import struct
+import tempfile
+import time
+from datetime import datetime
+import paho.mqtt.client as mqtt
+
+mqttServer = "127.0.0.1"
+
+# Where a direct replay writes unless told otherwise: never the live database,
+# spool or metrics port of a running database.py
+replay_database = "machine_replay"
+replay_metrics_port = 9109
+
+# Captures are gzip files of records (receive time as epoch seconds, topic
+# length, payload length) followed by the topic and the raw payload
+capture_magic = b"MQTTCAP1"
+record_header = struct.Struct("<dHH")
+
+def write_record(f, received, topic, payload):
+    topic = topic.encode()
+    f.write(record_header.pack(received, len(topic), len(payload)) + topic + payload)
+
+def read_records(path):
+    with gzip.open(path, "rb") as f:
+        if f.read(len(capture_magic)) != capture_magic:
+            raise ValueError(f"{path} is not an MQTT capture")
+        while True:
+            header = f.read(record_header.size)
+            if len(header) < record_header.size:
+                return
+            received, topic_length, payload_length = record_header.unpack(header)
+            yield received, f.read(topic_length).decode(), f.read(payload_length)
+
+# Message with the attributes database.ingest_message reads
+class CapturedMessage:
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+def record(path, topic_filter, duration):
+    count = 0
+    with gzip.open(path, "wb") as f:
+        f.write(capture_magic)
+
+        def on_connect(client, userdata, flags, rc):
+            client.subscribe(topic_filter)
+
+        def on_message(client, userdata, msg):
+            nonlocal count
+            write_record(f, time.time(), msg.topic, msg.payload)
+            count += 1
+
+        client = mqtt.Client()
+        client.on_connect = on_connect
+        client.on_message = on_message
+        client.connect(mqttServer, 1883, 60)
+        client.loop_start()
+        started = time.monotonic()
+        try:
+            while duration <= 0 or time.monotonic() - started < duration:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
+        client.loop_stop()
+        client.disconnect()
+    print(f"Recorded {count} messages to {path}")
+
+# Yield the records of a capture when they are due at `speed` times the
+# original rate; a speed of 0 yields them as fast as they are taken
+def paced(records, speed):
+    first = None
+    started = time.monotonic()
+    for received, topic, payload in records:
+        if speed > 0:
+            first = received if first is None else first
+            delay = started + (received - first) / speed - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield received, topic, payload
+
+# Publish a capture to the broker. With `stamp` the payloads carry the send
+# time like loadgen.py does, so loadcheck.py can measure the ingest
+def replay_broker(path, speed, stamp):
+    client = mqtt.Client()
+    client.connect(mqttServer, 1883, 60)
+    client.loop_start()
+    count = 0
+    started = time.monotonic()
+    for received, topic, payload in paced(read_records(path), speed):
+        if stamp:
+            payload = payload + f"|{time.time():.6f}".encode()
+        client.publish(topic, payload=payload)
+        count += 1
+    client.loop_stop()
+    client.disconnect()
+    print(f"Published {count} messages in {time.monotonic() - started:.1f} s")
+
+# Feed a capture straight into the ingest pipeline of database.py, with the
+# original receive times, and wait until the writers have committed it. The
+# replay must not target the live database: it would add the captured events
+# to its history and close or reopen its live intervals. The database, spool
+# and metrics port of database.py are overridden before it starts, and the
+# database is created if missing
+def replay_direct(path, speed, database_name, spool_path, metrics_port):
+    import database
+    import mysql.connector
+    if database_name == database.db_config["database"]:
+        raise SystemExit(f"Refusing to replay into the live database {database_name}")
+    if os.path.abspath(spool_path) == os.path.abspath(database.ingest_config["spool_path"]):
+        raise SystemExit(f"Refusing to replay into the live spool {spool_path}")
+
+    server_config = {key: value for key, value in database.db_config.items() if key != "database"}
+    connection = mysql.connector.connect(**server_config)
+    connection.cursor().execute(f"CREATE DATABASE IF NOT EXISTS {database_name}")
+    connection.close()
+
+    database.db_config["database"] = database_name
+    database.ingest_config["spool_path"] = spool_path
+    database.metrics_config["port"] = metrics_port
+    database.start(receive=False)
+    print(f"Replaying into database {database_name}, spool {spool_path}, metrics on port {metrics_port}")
+    count = 0
+    started = time.monotonic()
+    for received, topic, payload in paced(read_records(path), speed):
+        database.ingest_message(CapturedMessage(topic, payload), datetime.fromtimestamp(received))
+        count += 1
+    spooled = time.monotonic() - started
+    while database.spool.depth() > 0:
+        time.sleep(0.1)
+    elapsed = time.monotonic() - started
+    print(f"Spooled {count} messages in {spooled:.1f} s, written after {elapsed:.1f} s "
+          f"({count / elapsed if elapsed else 0:.0f} messages/s)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record MQTT relay traffic and replay it into the ingest")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    record_parser = commands.add_parser("record", help="capture messages to a file")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--topic", default="+/+/+")
+    record_parser.add_argument("--duration", type=float, default=0, help="seconds, 0 records until interrupted")
+
+    replay_parser = commands.add_parser("replay", help="replay a capture")
+    replay_parser.add_argument("path")
+    replay_parser.add_argument("--speed", type=float, default=1, help="times the original rate, 0 for as fast as possible")
+    replay_parser.add_argument("--direct", action="store_true", help="feed database.py in process instead of publishing to the broker")
+    replay_parser.add_argument("--stamp", action="store_true", help="append the send time to the payloads for loadcheck.py")
+    replay_parser.add_argument("--database", default=replay_database, help="database a direct replay writes to, never the live one")
+    replay_parser.add_argument("--spool", help="spool file of a direct replay, a new temporary file by default")
+    replay_parser.add_argument("--metrics-port", type=int, default=replay_metrics_port, help="metrics port of a direct replay")
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path, args.topic, args.duration)
+    elif args.direct:
+        spool_path = args.spool or os.path.join(tempfile.mkdtemp(prefix="replay-"), "spool.db")
+        replay_direct(args.path, args.speed, args.database, spool_path, args.metrics_port)
+    else:
+        replay_broker(args.path, args.speed, args.stamp)
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from machine_registry import machines, event_source
+from shift_calendar import ShiftCalendar, default_shifts
+
+# Seconds per (machine, bucket, status) at each granularity. Shift buckets start
+# at the working windows of the shift calendar; time outside them is not rolled up
+rollup_tables = ["rollup_minute", "rollup_hour", "rollup_shift", "rollup_day"]
+
+calendars = {}
+
+def calendar_for(machine):
+    if machine not in calendars:
+        calendars[machine] = ShiftCalendar(machines.get(machine, {}).get("shifts", default_shifts))
+    return calendars[machine]
+
+def floor_minute(moment):
+    return moment.replace(second=0, microsecond=0)
+
+def floor_hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+def floor_day(moment):
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+# Split [start, end) at fixed bucket boundaries into (bucket, seconds)
+def split_fixed(start, end, floor, step):
+    bucket = floor(start)
+    while bucket < end:
+        seconds = (min(end, bucket + step) - max(start, bucket)).total_seconds()
+        if seconds > 0:
+            yield bucket, seconds
+        bucket += step
+
+def split_shifts(start, end, calendar):
+    day = start.date()
+    while day <= end.date():
+        for window_start, window_end in calendar.windows(day):
+            seconds = (min(end, window_end) - max(start, window_start)).total_seconds()
+            if seconds > 0:
+                yield window_start, seconds
+        day += timedelta(days=1)
+
+def interval_buckets(machine, start, end):
+    return {
+        "rollup_minute": split_fixed(start, end, floor_minute, timedelta(minutes=1)),
+        "rollup_hour": split_fixed(start, end, floor_hour, timedelta(hours=1)),
+        "rollup_shift": split_shifts(start, end, calendar_for(machine)),
+        "rollup_day": split_fixed(start, end, floor_day, timedelta(days=1)),
+    }
+
+# Add closed intervals (machine, status, start, end) to every rollup. Each
+# interval is counted once, in the first bucket it adds seconds to: for shift
+# buckets that is the next window when it starts in a break or before the shifts
+def add_intervals(cursor, intervals):
+    totals = {table: {} for table in rollup_tables}
+    for machine, status, start, end in intervals:
+        for table, buckets in interval_buckets(machine, start, end).items():
+            first = True
+            for bucket, seconds in buckets:
+                key = (machine, bucket, status)
+                total = totals[table].setdefault(key, [0, 0])
+                total[0] += seconds
+                if first:
+                    total[1] += 1
+                    first = False
+
+    for table, rows in totals.items():
+        if not rows:
+            continue
+        cursor.executemany(
+            f"INSERT INTO {table} (machine_id, bucket, status, seconds, intervals) VALUES (%s, %s, %s, %s, %s) "
+            "ON DUPLICATE KEY UPDATE seconds = seconds + VALUES(seconds), intervals = intervals + VALUES(intervals)",
+            [key + (int(round(seconds)), count) for key, (seconds, count) in rows.items()]
+        )
+
+def interval_bounds(row_date, start_time, end_time):
+    start = datetime.combine(row_date, datetime.min.time()) + start_time
+    end = datetime.combine(row_date, datetime.min.time()) + end_time
+    if end < start:  # closed after midnight
+        end += timedelta(days=1)
+    return start, end
+
+# Rebuild one machine's rollups from its closed raw events, in id order and in chunks
+def backfill(cursor, machine, chunk_size=5000):
+    table, machine_where, machine_params = event_source(machine)
+    for rollup in rollup_tables:
+        cursor.execute(f"DELETE FROM {rollup} WHERE machine_id = %s", (machine,))
+
+    last_id = 0
+    while True:
+        cursor.execute(
+            f"SELECT id, date, start_time, end_time, status FROM {table} "
+            f"WHERE {machine_where}id > %s AND duration IS NOT NULL ORDER BY id LIMIT %s",
+            machine_params + (last_id, chunk_size)
+        )
+        rows = cursor.fetchall()
+        if not rows:
+            break
+        add_intervals(cursor, [(machine, status) + interval_bounds(row_date, start_time, end_time)
+                               for row_id, row_date, start_time, end_time, status in rows])
+        last_id = rows[-1][0]
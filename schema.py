@@ -0,0 +1,175 @@
+import mysql.connector
+from datetime import date
+from machine_registry import machines, machine_table, shared_events_table
+import rollups
+
+db_config = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",
+    "database": "machine"
+}
+
+# Months of events partitions kept ahead of today
+partition_months_ahead = 3
+
+def table_exists(cursor, table):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.TABLES WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s", (table,))
+    return cursor.fetchone()[0] > 0
+
+def column_exists(cursor, table, column):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND COLUMN_NAME = %s", (table, column))
+    return cursor.fetchone()[0] > 0
+
+def index_exists(cursor, table, index):
+    cursor.execute("SELECT COUNT(*) FROM information_schema.STATISTICS WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND INDEX_NAME = %s", (table, index))
+    return cursor.fetchone()[0] > 0
+
+def machine_tables():
+    return sorted({machine_table(machine) for machine in machines} - {shared_events_table})
+
+# Migration 1: the tables the ingest and dashboard have always used
+def create_base_tables(cursor):
+    for table in machine_tables():
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "date DATE NOT NULL, "
+            "start_time TIME NOT NULL, "
+            "end_time TIME NULL, "
+            "duration TIME NULL, "
+            "status VARCHAR(16) NOT NULL"
+            ")"
+        )
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS oee ("
+        "id VARCHAR(32) NOT NULL, "
+        "date DATE NOT NULL, "
+        "plan INT NOT NULL DEFAULT 0, "
+        "actual INT NOT NULL DEFAULT 0, "
+        "percentage VARCHAR(16) NULL, "
+        "PRIMARY KEY (id, date)"
+        ")"
+    )
+
+# Indexes of the machine tables, one per hot access path:
+#   idx_open        closing UPDATE (status, duration IS NULL) and the GROUP BY status counters
+#   idx_oee         OEE COUNT(*) by date, status and duration
+#   idx_date_start  dashboard date range, keyset pages and high-water-mark reads
+machine_indexes = {
+    "idx_open": "(status, duration, end_time, start_time)",
+    "idx_oee": "(date, status, duration)",
+    "idx_date_start": "(date, start_time, status, end_time, duration)",
+}
+
+# Migration 2: a primary key to address single intervals, and covering indexes
+def add_machine_indexes(cursor):
+    for table in machine_tables():
+        if not column_exists(cursor, table, "id"):
+            cursor.execute(f"ALTER TABLE {table} ADD COLUMN id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY FIRST")
+        for index, columns in machine_indexes.items():
+            if not index_exists(cursor, table, index):
+                cursor.execute(f"ALTER TABLE {table} ADD INDEX {index} {columns}")
+
+# Migration 3: one events table for all machines, keyed by machine id and
+# partitioned by month on date. The partition column has to be part of the primary key
+def create_events_table(cursor):
+    cursor.execute(
+        f"CREATE TABLE IF NOT EXISTS {shared_events_table} ("
+        "id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT, "
+        "machine_id VARCHAR(32) NOT NULL, "
+        "date DATE NOT NULL, "
+        "start_time TIME NOT NULL, "
+        "end_time TIME NULL, "
+        "duration TIME NULL, "
+        "status VARCHAR(16) NOT NULL, "
+        "PRIMARY KEY (id, date), "
+        "KEY idx_open (machine_id, status, duration, end_time, start_time), "
+        "KEY idx_oee (machine_id, date, status, duration), "
+        "KEY idx_date_start (machine_id, date, start_time, status, end_time, duration)"
+        ") PARTITION BY RANGE COLUMNS(date) (PARTITION p_max VALUES LESS THAN (MAXVALUE))"
+    )
+    ensure_partitions(cursor)
+
+# Migration 4: per-machine rollups by minute, hour, shift and day, filled from
+# the closed events already stored
+def create_rollup_tables(cursor):
+    for table in rollups.rollup_tables:
+        cursor.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "machine_id VARCHAR(32) NOT NULL, "
+            "bucket DATETIME NOT NULL, "
+            "status VARCHAR(16) NOT NULL, "
+            "seconds INT NOT NULL DEFAULT 0, "
+            "intervals INT NOT NULL DEFAULT 0, "
+            "PRIMARY KEY (machine_id, bucket, status)"
+            ")"
+        )
+    for machine in machines:
+        if table_exists(cursor, machine_table(machine)):
+            rollups.backfill(cursor, machine)
+
+migrations = [
+    (1, "machine and oee tables", create_base_tables),
+    (2, "machine table ids and indexes", add_machine_indexes),
+    (3, "shared events table", create_events_table),
+    (4, "rollup tables", create_rollup_tables),
+]
+
+def month_start(day, months):
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+# Split monthly partitions off p_max until partition_months_ahead months are covered
+def ensure_partitions(cursor, today=None):
+    today = today or date.today()
+    cursor.execute(
+        "SELECT PARTITION_NAME FROM information_schema.PARTITIONS "
+        "WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND PARTITION_NAME IS NOT NULL",
+        (shared_events_table,)
+    )
+    existing = {row[0] for row in cursor.fetchall()}
+    for months in range(partition_months_ahead + 1):
+        start = month_start(today, months)
+        name = f"p{start:%Y%m}"
+        if name in existing:
+            continue
+        cursor.execute(
+            f"ALTER TABLE {shared_events_table} REORGANIZE PARTITION p_max INTO ("
+            f"PARTITION {name} VALUES LESS THAN ('{month_start(start, 1)}'), "
+            "PARTITION p_max VALUES LESS THAN (MAXVALUE))"
+        )
+
+def current_version(cursor):
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        "version INT NOT NULL PRIMARY KEY, "
+        "description VARCHAR(255) NOT NULL, "
+        "applied_at DATETIME NOT NULL"
+        ")"
+    )
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return cursor.fetchone()[0]
+
+# Apply every migration newer than the recorded version, in order
+def migrate(connection):
+    cursor = connection.cursor()
+    version = current_version(cursor)
+    for number, description, apply in migrations:
+        if number <= version:
+            continue
+        print(f"Applying schema migration {number}: {description}")
+        apply(cursor)
+        cursor.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (%s, %s, NOW())", (number, description))
+        connection.commit()
+    # Machines added to the registry later still get their table and indexes
+    create_base_tables(cursor)
+    add_machine_indexes(cursor)
+    if table_exists(cursor, shared_events_table):
+        ensure_partitions(cursor)
+    connection.commit()
+    cursor.close()
+
+if __name__ == "__main__":
+    connection = mysql.connector.connect(**db_config)
+    migrate(connection)
+    connection.close()
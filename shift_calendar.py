@@ -0,0 +1,53 @@
+from datetime import datetime, timedelta, time as dtime
+
+# Working windows per weekday (0 = Monday ... 6 = Sunday) as (start, end) in HHMM.
+# The gaps between windows are breaks; the end of the last window is the end of shift
+default_shifts = {
+    weekday: [(740, 1000), (1010, 1200), (1245, 1415), (1425, 1615)]
+    for weekday in (0, 1, 2, 3, 5, 6)
+}
+default_shifts[4] = [(740, 1000), (1010, 1145), (1300, 1415), (1425, 1545), (1630, 1645)]
+
+def hhmm(value):
+    return dtime(value // 100, value % 100)
+
+class ShiftCalendar:
+    def __init__(self, shifts=None):
+        self.shifts = shifts or default_shifts
+
+    def windows(self, day):
+        return [
+            (datetime.combine(day, hhmm(start)), datetime.combine(day, hhmm(end)))
+            for start, end in self.shifts.get(day.weekday(), [])
+            if start < end
+        ]
+
+    # Seconds of working time on `day` up to `moment`
+    def shift_seconds(self, day, moment):
+        total = 0
+        for start, end in self.windows(day):
+            if moment <= start:
+                break
+            total += (min(moment, end) - start).total_seconds()
+        return total
+
+    # Wall-clock time at which `seconds` of working time have passed on `day`,
+    # or None when the day has less working time than that
+    def time_at(self, day, seconds):
+        for start, end in self.windows(day):
+            length = (end - start).total_seconds()
+            if seconds < length:
+                return start + timedelta(seconds=seconds)
+            seconds -= length
+        return None
+
+    def shift_end(self, day):
+        windows = self.windows(day)
+        return windows[-1][1] if windows else None
+
+    # Index of the working window containing `moment`, or None during breaks
+    def window_index(self, moment):
+        for index, (start, end) in enumerate(self.windows(moment.date())):
+            if start <= moment < end:
+                return index
+        return None
@@ -0,0 +1,125 @@
+import sqlite3
+import threading
+from datetime import datetime
+
+# Local write-ahead spool of ingest events. Events are appended as they arrive
+# and deleted once they are committed to MySQL, so an outage or a restart of
+# the ingest only delays them. Each writer worker reads and acks the events of
+# its own machines, which keeps the events of one machine in order.
+# synchronous=NORMAL survives a crash of the process; FULL also survives a
+# power cut at the cost of an fsync per event. Events MySQL keeps rejecting
+# are moved to dead_events with the error, to be inspected and replayed by hand
+class Spool:
+    def __init__(self, path, synchronous="NORMAL"):
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute(f"PRAGMA synchronous={synchronous}")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+            "machine TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "active INTEGER NOT NULL, "
+            "timestamp TEXT NOT NULL, "
+            "sent REAL NULL"
+            ")"
+        )
+        # Spools written before events carried a send time
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(events)")]
+        if "sent" not in columns:
+            self.connection.execute("ALTER TABLE events ADD COLUMN sent REAL NULL")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS idx_machine_seq ON events (machine, seq)")
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS dead_events ("
+            "seq INTEGER PRIMARY KEY, "
+            "machine TEXT NOT NULL, "
+            "status TEXT NOT NULL, "
+            "active INTEGER NOT NULL, "
+            "timestamp TEXT NOT NULL, "
+            "sent REAL NULL, "
+            "error TEXT NOT NULL, "
+            "failed TEXT NOT NULL"
+            ")"
+        )
+        # Reentrant, since depth() is called both on its own and from within wait()
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+        self.pending = dict(self.connection.execute("SELECT machine, COUNT(*) FROM events GROUP BY machine").fetchall())
+
+    def append(self, event):
+        with self.lock:
+            self.connection.execute(
+                "INSERT INTO events (machine, status, active, timestamp, sent) VALUES (?, ?, ?, ?, ?)",
+                (event.machine, event.status, int(event.active), event.timestamp.isoformat(), event.sent)
+            )
+            self.pending[event.machine] = self.pending.get(event.machine, 0) + 1
+            self.changed.notify_all()
+
+    # Events spooled and not yet acked, of the given machines or of all of them
+    def depth(self, machines=None):
+        with self.lock:
+            if machines is None:
+                return sum(self.pending.values())
+            return sum(self.pending.get(machine, 0) for machine in machines)
+
+    # Block until at least `count` events of `machines` are spooled or `timeout`
+    # seconds have passed (None waits for the first event only), and return the
+    # number pending
+    def wait(self, machines, count=1, timeout=None):
+        with self.lock:
+            if timeout is None:
+                self.changed.wait_for(lambda: self.depth(machines) > 0)
+            else:
+                self.changed.wait_for(lambda: self.depth(machines) >= count, timeout)
+            return self.depth(machines)
+
+    # Block until fewer than `count` events are spooled or `timeout` seconds have passed
+    def wait_below(self, count, timeout):
+        with self.lock:
+            return self.changed.wait_for(lambda: self.depth() < count, timeout)
+
+    # Oldest spooled events of `machines` in arrival order, as
+    # (seq, machine, status, active, timestamp, sent)
+    def read(self, machines, limit):
+        placeholders = ", ".join(["?"] * len(machines))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT seq, machine, status, active, timestamp, sent FROM events WHERE machine IN ({placeholders}) ORDER BY seq LIMIT ?",
+                tuple(machines) + (limit,)
+            ).fetchall()
+        return [(seq, machine, status, bool(active), datetime.fromisoformat(timestamp), sent)
+                for seq, machine, status, active, timestamp, sent in rows]
+
+    # Drop every event of `machines` up to and including `seq` once it is safely in MySQL
+    def ack(self, machines, seq):
+        placeholders = ", ".join(["?"] * len(machines))
+        with self.lock:
+            rows = self.connection.execute(
+                f"SELECT machine, COUNT(*) FROM events WHERE machine IN ({placeholders}) AND seq <= ? GROUP BY machine",
+                tuple(machines) + (seq,)
+            ).fetchall()
+            self.connection.execute(f"DELETE FROM events WHERE machine IN ({placeholders}) AND seq <= ?", tuple(machines) + (seq,))
+            for machine, count in rows:
+                self.pending[machine] -= count
+            self.changed.notify_all()
+
+    # Move the event `seq` out of the queue into dead_events
+    def dead_letter(self, seq, error):
+        with self.lock:
+            row = self.connection.execute("SELECT machine FROM events WHERE seq = ?", (seq,)).fetchone()
+            if row is None:
+                return
+            self.connection.execute("BEGIN")
+            self.connection.execute(
+                "INSERT OR REPLACE INTO dead_events (seq, machine, status, active, timestamp, sent, error, failed) "
+                "SELECT seq, machine, status, active, timestamp, sent, ?, ? FROM events WHERE seq = ?",
+                (error, datetime.now().isoformat(), seq)
+            )
+            self.connection.execute("DELETE FROM events WHERE seq = ?", (seq,))
+            self.connection.execute("COMMIT")
+            self.pending[row[0]] -= 1
+            self.changed.notify_all()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,41 @@
+import re
+
+table_columns = ['date', 'start_time', 'end_time', 'duration', 'status']
+
+# Keyset order for each sortable column; end_time and duration can be NULL
+# and are paged by offset instead. Start Time sorts by time of day first
+sort_keys = {
+    'date': ['date', 'start_time', 'status'],
+    'start_time': ['start_time', 'date', 'status'],
+    'status': ['status', 'date', 'start_time'],
+}
+
+filter_operators = {
+    '=': '=', 'eq': '=', '!=': '<>', 'ne': '<>',
+    '<': '<', 'lt': '<', '<=': '<=', 'le': '<=',
+    '>': '>', 'gt': '>', '>=': '>=', 'ge': '>=',
+    'contains': 'LIKE', 'datestartswith': 'LIKE',
+}
+
+# Translate the datatable filter_query into SQL conditions on whitelisted columns
+def parse_filter(filter_query):
+    conditions, params = [], []
+    for part in (filter_query or '').split(' && '):
+        match = re.match(r"\s*\{(\w+)\}\s+(\S+)\s+(.*)", part)
+        if not match:
+            continue
+        column, operator, value = match.groups()
+        if operator not in filter_operators and operator[:1] in ('s', 'i'):
+            operator = operator[1:]
+        if column not in table_columns or operator not in filter_operators:
+            continue
+        value = value.strip()
+        if len(value) > 1 and value[0] in ('"', "'", '`') and value[-1] == value[0]:
+            value = value[1:-1]
+        if operator == 'contains':
+            value = f"%{value}%"
+        elif operator == 'datestartswith':
+            value = f"{value}%"
+        conditions.append(f"{column} {filter_operators[operator]} %s")
+        params.append(value)
+    return conditions, params
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+import pytest
+
+pytest.importorskip("paho.mqtt.client")
+pytest.importorskip("mysql.connector")
+import database
+
+# fanuc plans a part every 2.32 minutes (139 s) of working time; 2026-10-12 is a Monday
+cycle = timedelta(seconds=139)
+first_window = datetime(2026, 10, 12, 7, 40)
+
+@pytest.fixture(autouse=True)
+def fresh_ticks(monkeypatch):
+    monkeypatch.setattr(database, "next_ticks", {})
+
+def test_plan_ticks_due_on_restart_continues_the_phase():
+    # 80 minutes of working time have passed: the next tick is the 35th
+    ticks, due = database.plan_ticks_due("fanuc", datetime(2026, 10, 12, 9, 0))
+    assert ticks == 0
+    assert due == first_window + 35 * cycle
+    assert database.plan_ticks_due("fanuc", due) == (1, first_window + 36 * cycle)
+
+def test_plan_ticks_due_at_rollover_starts_from_the_first_window():
+    database.next_ticks["fanuc"] = (datetime(2026, 10, 11).date(), 20000)
+    ticks, due = database.plan_ticks_due("fanuc", datetime(2026, 10, 12, 7, 45))
+    assert ticks == 3
+    assert due == first_window + 3 * cycle
+
+def test_plan_ticks_due_skips_breaks():
+    # The first window ends at 10:00 after 140 minutes of working time
+    database.next_ticks["fanuc"] = (first_window.date(), 60 * 139)
+    ticks, due = database.plan_ticks_due("fanuc", datetime(2026, 10, 12, 10, 5))
+    assert ticks == 1
+    assert due == datetime(2026, 10, 12, 10, 10) + timedelta(seconds=61 * 139 - 140 * 60)
+
+def test_plan_ticks_due_before_the_first_window():
+    assert database.plan_ticks_due("fanuc", datetime(2026, 10, 12, 6, 0)) == (0, first_window)
+
+def test_plan_ticks_due_after_the_shift():
+    database.next_ticks["fanuc"] = (first_window.date(), 1000000)
+    assert database.plan_ticks_due("fanuc", datetime(2026, 10, 12, 17, 0)) == (0, None)
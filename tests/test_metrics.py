@@ -0,0 +1,38 @@
+import metrics
+
+def test_histogram_samples_are_cumulative():
+    histogram = metrics.Histogram("write_seconds", "Write time", (0.1, 1))
+    for value in (0.05, 0.1, 0.5, 2):
+        histogram.observe(value)
+    assert histogram.samples() == [
+        ("write_seconds_bucket", (("le", "0.1"),), 2),
+        ("write_seconds_bucket", (("le", "1"),), 3),
+        ("write_seconds_bucket", (("le", "+Inf"),), 4),
+        ("write_seconds_sum", (), 2.65),
+        ("write_seconds_count", (), 4),
+    ]
+
+def test_histogram_samples_per_label_set():
+    histogram = metrics.Histogram("batch_events", "Events per batch", (10,))
+    histogram.observe(5, worker="a")
+    histogram.observe(50, worker="b")
+    samples = {(name, labels): value for name, labels, value in histogram.samples()}
+    assert samples[("batch_events_bucket", (("worker", "a"), ("le", "10")))] == 1
+    assert samples[("batch_events_bucket", (("worker", "b"), ("le", "10")))] == 0
+    assert samples[("batch_events_count", (("worker", "b"),))] == 1
+
+def test_empty_histogram_has_no_samples():
+    assert metrics.Histogram("idle", "Nothing observed").samples() == []
+
+def test_render():
+    registry = metrics.Registry()
+    registry.counter("messages_total", "Messages").inc(3, kind="relay")
+    registry.gauge("depth", "Depth", lambda: 7)
+    assert registry.render() == (
+        "# HELP messages_total Messages\n"
+        "# TYPE messages_total counter\n"
+        'messages_total{kind="relay"} 3\n'
+        "# HELP depth Depth\n"
+        "# TYPE depth gauge\n"
+        "depth 7\n"
+    )
@@ -0,0 +1,75 @@
+from datetime import datetime, timedelta
+import rollups
+from rollups import split_fixed, split_shifts, floor_hour, floor_day
+from shift_calendar import ShiftCalendar
+
+# 2026-10-12 is a Monday, 2026-10-16 a Friday
+calendar = ShiftCalendar()
+
+class RecordingCursor:
+    def __init__(self):
+        self.rows = {}
+
+    def executemany(self, statement, rows):
+        self.rows[statement.split()[2]] = rows
+
+def test_split_fixed_across_midnight():
+    buckets = list(split_fixed(datetime(2026, 10, 12, 23, 30), datetime(2026, 10, 13, 1, 15), floor_hour, timedelta(hours=1)))
+    assert buckets == [
+        (datetime(2026, 10, 12, 23), 1800),
+        (datetime(2026, 10, 13, 0), 3600),
+        (datetime(2026, 10, 13, 1), 900),
+    ]
+
+def test_split_fixed_by_day():
+    buckets = list(split_fixed(datetime(2026, 10, 12, 22), datetime(2026, 10, 13, 2), floor_day, timedelta(days=1)))
+    assert buckets == [(datetime(2026, 10, 12), 7200), (datetime(2026, 10, 13), 7200)]
+
+def test_split_fixed_empty_interval():
+    moment = datetime(2026, 10, 12, 10)
+    assert list(split_fixed(moment, moment, floor_hour, timedelta(hours=1))) == []
+
+def test_split_shifts_skips_breaks():
+    buckets = list(split_shifts(datetime(2026, 10, 12, 9, 50), datetime(2026, 10, 12, 10, 20), calendar))
+    assert buckets == [(datetime(2026, 10, 12, 7, 40), 600), (datetime(2026, 10, 12, 10, 10), 600)]
+
+def test_split_shifts_across_midnight():
+    buckets = list(split_shifts(datetime(2026, 10, 12, 16, 0), datetime(2026, 10, 13, 7, 50), calendar))
+    assert buckets == [(datetime(2026, 10, 12, 14, 25), 900), (datetime(2026, 10, 13, 7, 40), 600)]
+
+def test_split_shifts_outside_working_time():
+    assert list(split_shifts(datetime(2026, 10, 12, 17), datetime(2026, 10, 13, 7), calendar)) == []
+
+def test_split_shifts_friday_windows():
+    buckets = list(split_shifts(datetime(2026, 10, 16, 15, 40), datetime(2026, 10, 16, 17), calendar))
+    assert buckets == [(datetime(2026, 10, 16, 14, 25), 300), (datetime(2026, 10, 16, 16, 30), 900)]
+
+def test_add_intervals_counts_each_interval_once():
+    cursor = RecordingCursor()
+    rollups.add_intervals(cursor, [("fanuc", "RUNNING", datetime(2026, 10, 12, 9, 30), datetime(2026, 10, 12, 11, 30))])
+    for table in rollups.rollup_tables:
+        assert sum(row[4] for row in cursor.rows[table]) == 1
+    assert [row[1:] for row in cursor.rows["rollup_shift"]] == [
+        (datetime(2026, 10, 12, 7, 40), "RUNNING", 1800, 1),
+        (datetime(2026, 10, 12, 10, 10), "RUNNING", 4800, 0),
+    ]
+
+def test_add_intervals_counts_interval_starting_in_a_break():
+    cursor = RecordingCursor()
+    rollups.add_intervals(cursor, [("fanuc", "IDLE", datetime(2026, 10, 12, 12, 10), datetime(2026, 10, 12, 13, 0))])
+    assert [row[1:] for row in cursor.rows["rollup_shift"]] == [(datetime(2026, 10, 12, 12, 45), "IDLE", 900, 1)]
+    assert [row[1:] for row in cursor.rows["rollup_hour"]] == [
+        (datetime(2026, 10, 12, 12), "IDLE", 3000, 1),
+    ]
+
+def test_add_intervals_sums_intervals_of_one_bucket():
+    cursor = RecordingCursor()
+    rollups.add_intervals(cursor, [
+        ("fanuc", "DOWN", datetime(2026, 10, 12, 8, 0), datetime(2026, 10, 12, 8, 10)),
+        ("fanuc", "DOWN", datetime(2026, 10, 12, 8, 20), datetime(2026, 10, 12, 8, 25)),
+    ])
+    assert [row[1:] for row in cursor.rows["rollup_hour"]] == [(datetime(2026, 10, 12, 8), "DOWN", 900, 2)]
+
+def test_interval_bounds_closed_after_midnight():
+    start, end = rollups.interval_bounds(datetime(2026, 10, 12).date(), timedelta(hours=23), timedelta(hours=1))
+    assert (start, end) == (datetime(2026, 10, 12, 23), datetime(2026, 10, 13, 1))
@@ -0,0 +1,29 @@
+from datetime import datetime, date
+from shift_calendar import ShiftCalendar
+
+calendar = ShiftCalendar()
+monday = date(2026, 10, 12)
+
+def test_shift_seconds_skips_breaks():
+    assert calendar.shift_seconds(monday, datetime(2026, 10, 12, 7, 0)) == 0
+    assert calendar.shift_seconds(monday, datetime(2026, 10, 12, 10, 5)) == 140 * 60
+    assert calendar.shift_seconds(monday, datetime(2026, 10, 12, 10, 20)) == 150 * 60
+
+def test_time_at_is_the_inverse_of_shift_seconds():
+    for moment in (datetime(2026, 10, 12, 8, 15), datetime(2026, 10, 12, 10, 10), datetime(2026, 10, 12, 15, 0)):
+        assert calendar.time_at(monday, calendar.shift_seconds(monday, moment)) == moment
+
+def test_time_at_past_the_shift():
+    assert calendar.time_at(monday, 24 * 3600) is None
+
+def test_window_index_and_shift_end():
+    assert calendar.window_index(datetime(2026, 10, 12, 7, 40)) == 0
+    assert calendar.window_index(datetime(2026, 10, 12, 10, 5)) is None
+    assert calendar.window_index(datetime(2026, 10, 12, 16, 14)) == 3
+    assert calendar.shift_end(monday) == datetime(2026, 10, 12, 16, 15)
+    assert calendar.shift_end(date(2026, 10, 16)) == datetime(2026, 10, 16, 16, 45)
+
+def test_day_without_shifts():
+    calendar = ShiftCalendar({0: [(800, 1600)]})
+    assert calendar.windows(date(2026, 10, 13)) == []
+    assert calendar.shift_end(date(2026, 10, 13)) is None
@@ -0,0 +1,37 @@
+from collections import namedtuple
+from datetime import datetime
+from spool import Spool
+
+Event = namedtuple("Event", ["machine", "status", "active", "timestamp", "sent"])
+
+def spooled(tmp_path, *machines):
+    spool = Spool(str(tmp_path / "spool.db"))
+    for machine in machines:
+        spool.append(Event(machine, "RUNNING", True, datetime(2026, 10, 12, 8), None))
+    return spool
+
+def test_read_and_ack_per_machine(tmp_path):
+    spool = spooled(tmp_path, "a", "b", "a")
+    rows = spool.read(["a"], 10)
+    assert [row[1] for row in rows] == ["a", "a"]
+    assert rows[0][3] is True and rows[0][4] == datetime(2026, 10, 12, 8)
+    spool.ack(["a"], rows[-1][0])
+    assert spool.depth() == 1
+    assert spool.depth(["a"]) == 0
+
+def test_pending_counts_survive_reopening(tmp_path):
+    spooled(tmp_path, "a", "b").close()
+    assert Spool(str(tmp_path / "spool.db")).depth(["a", "b"]) == 2
+
+def test_dead_letter_keeps_the_event_out_of_the_queue(tmp_path):
+    spool = spooled(tmp_path, "a", "a")
+    first, second = spool.read(["a"], 10)
+    spool.dead_letter(first[0], "bad event")
+    assert spool.depth() == 1
+    assert spool.read(["a"], 10) == [second]
+    assert spool.connection.execute("SELECT seq, error FROM dead_events").fetchall() == [(first[0], "bad event")]
+
+def test_wait_returns_on_timeout(tmp_path):
+    spool = spooled(tmp_path, "a")
+    assert spool.wait(["a"], count=5, timeout=0.01) == 1
+    assert spool.wait_below(1, timeout=0.01) is False
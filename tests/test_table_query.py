@@ -0,0 +1,28 @@
+from table_query import parse_filter
+
+def test_empty_filter():
+    assert parse_filter('') == ([], [])
+    assert parse_filter(None) == ([], [])
+
+def test_comparisons_and_conjunction():
+    conditions, params = parse_filter('{status} = RUNNING && {duration} > 00:05:00')
+    assert conditions == ['status = %s', 'duration > %s']
+    assert params == ['RUNNING', '00:05:00']
+
+def test_word_operators_and_case_prefixes():
+    conditions, params = parse_filter('{status} seq IDLE && {date} ige 2026-10-01 && {date} ne 2026-10-02')
+    assert conditions == ['status = %s', 'date >= %s', 'date <> %s']
+    assert params == ['IDLE', '2026-10-01', '2026-10-02']
+
+def test_quoted_values():
+    assert parse_filter('{status} = "DOWN"') == (['status = %s'], ['DOWN'])
+    assert parse_filter("{status} = 'DOWN'") == (['status = %s'], ['DOWN'])
+
+def test_like_operators():
+    assert parse_filter('{status} contains UN') == (['status LIKE %s'], ['%UN%'])
+    assert parse_filter('{date} datestartswith 2026-10') == (['date LIKE %s'], ['2026-10%'])
+
+def test_unknown_columns_and_operators_are_dropped():
+    conditions, params = parse_filter('{id} = 1 && {status} ~ RUNNING && {status}; DROP TABLE fanuc && {date} = 2026-10-12')
+    assert conditions == ['date = %s']
+    assert params == ['2026-10-12']
@@ -0,0 +1,58 @@
+import pytest
+from timeline import StateTimeline
+
+def timeline_of(*transitions, window=3600):
+    timeline = StateTimeline(window)
+    for timestamp, status in transitions:
+        timeline.append(timestamp, status)
+    return timeline
+
+def test_append_ignores_repeated_status_and_older_timestamps():
+    timeline = timeline_of((100, 'RUNNING'), (150, 'RUNNING'), (200, 'IDLE'), (180, 'DOWN'))
+    assert list(timeline.times) == [100, 200]
+    assert timeline.current().status == 'IDLE'
+    assert timeline.current().start == 200
+
+def test_current_of_empty_timeline():
+    assert StateTimeline(3600).current() is None
+
+def test_covers():
+    timeline = timeline_of((100, 'RUNNING'))
+    assert timeline.covers(100)
+    assert timeline.covers(150)
+    assert not timeline.covers(99)
+    assert not StateTimeline(3600).covers(0)
+
+def test_seconds_between():
+    timeline = timeline_of((100, 'RUNNING'), (200, 'IDLE'), (260, None), (300, 'DOWN'))
+    assert timeline.seconds_between(150, 400) == {'RUNNING': 50, 'IDLE': 60, 'DOWN': 100}
+
+def test_seconds_between_within_one_entry():
+    timeline = timeline_of((100, 'RUNNING'), (500, 'IDLE'))
+    assert timeline.seconds_between(200, 300) == {'RUNNING': 100, 'IDLE': 0, 'DOWN': 0}
+
+def test_slice_clips_to_range():
+    timeline = timeline_of((100, 'RUNNING'), (200, 'IDLE'), (300, 'DOWN'))
+    starts, ends, codes = timeline.slice(150, 250)
+    assert starts.tolist() == [150, 200]
+    assert ends.tolist() == [200, 250]
+    assert codes.tolist() == [1, 2]
+
+def test_intervals_longer_than():
+    timeline = timeline_of((0, 'RUNNING'), (100, 'IDLE'), (110, 'RUNNING'), (400, None), (500, 'DOWN'))
+    intervals = timeline.intervals_longer_than(90, t0=0, t1=600)
+    assert [(interval.start, interval.end, interval.status) for interval in intervals] == [
+        (0, 100, 'RUNNING'), (110, 400, 'RUNNING'), (500, 600, 'DOWN'),
+    ]
+    running = timeline.intervals_longer_than(90, 'RUNNING', t0=0, t1=600)
+    assert [interval.start for interval in running] == [0, 110]
+
+def test_trimming_keeps_the_state_at_the_window_start():
+    timeline = StateTimeline(100)
+    statuses = ['RUNNING', 'IDLE']
+    for step in range(1000):
+        timeline.append(step * 10, statuses[step % 2])
+    # Trimmed in steps, so at most a few windows of entries are kept
+    assert len(timeline.times) <= 4 * 11
+    assert timeline.covers(9990 - 100)
+    assert timeline.seconds_between(9890, 9990) == pytest.approx({'RUNNING': 50, 'IDLE': 50, 'DOWN': 0})
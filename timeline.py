@@ -0,0 +1,80 @@
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+import numpy as np
+
+status_codes = {None: 0, 'RUNNING': 1, 'IDLE': 2, 'DOWN': 3}
+status_names = [None, 'RUNNING', 'IDLE', 'DOWN']
+
+class Interval:
+    __slots__ = ("start", "end", "status")
+
+    def __init__(self, start, end, status):
+        self.start = start
+        self.end = end
+        self.status = status
+
+# Append-only timeline of one machine's transitions as parallel arrays of epoch
+# seconds and status codes. Each entry holds until the next one; entries older
+# than `window` seconds are dropped, except the one giving the state at the
+# start of the window. Queries find their range by bisection and work on NumPy
+# copies of just that range
+class StateTimeline:
+    __slots__ = ("window", "times", "codes", "lock")
+
+    def __init__(self, window):
+        self.window = window
+        self.times = array('d')
+        self.codes = array('b')
+        self.lock = threading.Lock()
+
+    def append(self, timestamp, status):
+        code = status_codes[status]
+        with self.lock:
+            if self.times and (timestamp < self.times[-1] or code == self.codes[-1]):
+                return
+            self.times.append(timestamp)
+            self.codes.append(code)
+            # Trim in steps so dropping old entries stays amortised O(1)
+            start = bisect_left(self.times, timestamp - self.window) - 1
+            if start > 0 and start * 4 >= len(self.times):
+                del self.times[:start]
+                del self.codes[:start]
+
+    # True when the timeline knows the state from t0 on
+    def covers(self, t0):
+        with self.lock:
+            return bool(self.times) and self.times[0] <= t0
+
+    def current(self):
+        with self.lock:
+            if not self.times:
+                return None
+            return Interval(self.times[-1], None, status_names[self.codes[-1]])
+
+    # Entries in effect between t0 and t1, clipped to [t0, t1]
+    def slice(self, t0, t1):
+        with self.lock:
+            first = max(0, bisect_right(self.times, t0) - 1)
+            last = bisect_left(self.times, t1)
+            times = np.frombuffer(self.times[first:last], dtype=np.float64)
+            codes = np.frombuffer(self.codes[first:last], dtype=np.int8)
+        starts = np.clip(times, t0, t1)
+        ends = np.append(starts[1:], t1)
+        return starts, ends, codes
+
+    def seconds_between(self, t0, t1=None):
+        starts, ends, codes = self.slice(t0, time.time() if t1 is None else t1)
+        totals = np.bincount(codes, weights=ends - starts, minlength=len(status_names))
+        return {name: float(totals[code]) for code, name in enumerate(status_names) if name}
+
+    # Intervals of at least `seconds` (in `status` if given) between t0 and t1;
+    # the interval still in effect is measured up to t1
+    def intervals_longer_than(self, seconds, status=None, t0=0, t1=None):
+        starts, ends, codes = self.slice(t0, time.time() if t1 is None else t1)
+        mask = (ends - starts >= seconds) & (codes != 0)
+        if status is not None:
+            mask &= codes == status_codes[status]
+        return [Interval(start, end, status_names[code])
+                for start, end, code in zip(starts[mask].tolist(), ends[mask].tolist(), codes[mask].tolist())]